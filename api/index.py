@@ -12,11 +12,13 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ['VERCEL'] = '1'
 
 # Import the Flask app
-from app import app, db, init_db
+from app import app, db, init_db, startup_report
 
-# Initialize database on cold start
+# Initialize database on cold start; skips schema/seed work once it has run
+# and leaves the admin bootstrap to the first login
 with app.app_context():
-    init_db()
+    init_db(fast=True)
+print(startup_report())
 
 # Vercel expects 'app' or 'application'
 application = app
@@ -1,14 +1,47 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, Response, g
+from flask import send_from_directory, abort, Request
+from flask import has_request_context, before_render_template, template_rendered
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, update, select, and_, cast, Integer, insert, delete, event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool, QueuePool, NullPool
+from sqlalchemy.orm import selectinload, aliased
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from datetime import datetime
+from werkzeug.exceptions import RequestEntityTooLarge
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple, OrderedDict, deque
+import bisect
+import functools
+import hashlib
+import io
+import itertools
+import json
+import re
+import threading
+import tempfile
+import sqlite3
 import random
 
 # Detect if running on Vercel
 IS_VERCEL = os.environ.get('VERCEL') == '1'
+
+
+def _gevent_patched():
+    """True under a cooperative server (e.g. gunicorn -k gevent), where idle streams are cheap."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Flask app - templates and static are in the same directory as app.py
@@ -20,10 +53,14 @@ app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'the-layoffs-are-coming-
 
 # Database configuration
 # Priority: POSTGRES_URL (Vercel) > DATABASE_URL > SQLite
+# Serverless SQLite lives in the writable temp dir so warm instances keep their bets
+SQLITE_PATH = os.environ.get('SQLITE_PATH') or (
+    os.path.join(tempfile.gettempdir(), 'layoffs_market.db') if IS_VERCEL else 'layoffs_market.db'
+)
 database_url = (
     os.environ.get('POSTGRES_URL') or  # Vercel Postgres
     os.environ.get('DATABASE_URL') or  # Generic
-    ('sqlite:///:memory:' if IS_VERCEL else 'sqlite:///layoffs_market.db')
+    f'sqlite:///{SQLITE_PATH}'
 )
 
 # Fix for postgres:// vs postgresql:// (required by SQLAlchemy)
@@ -35,6 +72,183 @@ print(f"Database: {'PostgreSQL' if 'postgresql' in database_url else 'SQLite'}")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', 'static/uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
+# Photo uploads: per-file limit enforced while streaming, thumbnail workers and how many may queue
+app.config['PHOTO_MAX_BYTES'] = int(os.environ.get('PHOTO_MAX_BYTES', 16 * 1024 * 1024))
+app.config['PHOTO_WORKERS'] = int(os.environ.get('PHOTO_WORKERS', 2))
+app.config['PHOTO_QUEUE_LIMIT'] = int(os.environ.get('PHOTO_QUEUE_LIMIT', 8))
+# Settlement runs on a background thread locally; serverless has no process to keep it alive
+app.config['SETTLEMENT_ASYNC'] = os.environ.get('SETTLEMENT_ASYNC', '0' if IS_VERCEL else '1') == '1'
+app.config['SETTLEMENT_BATCH_SIZE'] = int(os.environ.get('SETTLEMENT_BATCH_SIZE', 500))
+# A running job whose heartbeat is older than this (seconds) is presumed dead and may be reclaimed
+app.config['SETTLEMENT_LEASE'] = int(os.environ.get('SETTLEMENT_LEASE', 120))
+# Other workers change balances too; resync the in-memory leaderboard this often (seconds)
+app.config['LEADERBOARD_TTL'] = int(os.environ.get('LEADERBOARD_TTL', 30))
+app.config['BET_HISTORY_PAGE_SIZE'] = 25
+# Rendered public pages: 'memory' (per process), 'filesystem' (shared by local workers) or 'none'
+app.config['PAGE_CACHE_BACKEND'] = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+app.config['PAGE_CACHE_TTL'] = int(os.environ.get('PAGE_CACHE_TTL', 60))
+app.config['PAGE_CACHE_SIZE'] = int(os.environ.get('PAGE_CACHE_SIZE', 512))
+app.config['PAGE_CACHE_DIR'] = os.environ.get('PAGE_CACHE_DIR', os.path.join(BASE_DIR, 'instance', 'page_cache'))
+# Server-sent events hold a connection per client, so they default on only under gevent;
+# everyone else (and serverless) polls. Streams are per process: clients keep a slow poll as backstop
+app.config['EVENTS_ENABLED'] = os.environ.get(
+    'EVENTS_ENABLED', '1' if _gevent_patched() and not IS_VERCEL else '0') == '1'
+app.config['EVENTS_HEARTBEAT'] = int(os.environ.get('EVENTS_HEARTBEAT', 15))
+# Odds follow the money: shifted per position by stakes, at most once per interval (seconds). Opt-in
+app.config['ODDS_ENGINE_ENABLED'] = os.environ.get('ODDS_ENGINE_ENABLED', '0') == '1'
+app.config['ODDS_ASYNC'] = os.environ.get('ODDS_ASYNC', '0' if IS_VERCEL else '1') == '1'
+app.config['ODDS_INTERVAL'] = float(os.environ.get('ODDS_INTERVAL', 2))
+app.config['ODDS_PRIOR_STAKE'] = int(os.environ.get('ODDS_PRIOR_STAKE', 500))  # Coins behind the opening odds
+# Snapshots only fold in ledger entries at least this many seconds old
+app.config['LEDGER_SNAPSHOT_LAG'] = int(os.environ.get('LEDGER_SNAPSHOT_LAG', 60))
+# Idempotency keys on /bet: stored results are kept this long (seconds); a worker
+# also answers replays from memory for a few minutes
+app.config['IDEMPOTENCY_TTL'] = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 3600))
+app.config['IDEMPOTENCY_MEMORY_TTL'] = int(os.environ.get('IDEMPOTENCY_MEMORY_TTL', 300))
+app.config['IDEMPOTENCY_WAIT'] = float(os.environ.get('IDEMPOTENCY_WAIT', 10))  # For a duplicate still running
+# Per-request query counts and timings in Server-Timing headers and /admin/queries
+app.config['QUERY_STATS_ENABLED'] = os.environ.get('QUERY_STATS_ENABLED', '0') == '1'
+app.config['QUERY_STATS_HISTORY'] = int(os.environ.get('QUERY_STATS_HISTORY', 500))  # Requests kept
+
+
+# ============== DATABASE ENGINE ==============
+
+# Postgres engine profiles, picked with DB_ENGINE_PROFILE:
+# - server:     long-running workers keep a real pool of warm connections
+# - serverless: each function instance keeps one warm connection, a little overflow
+# - pooler:     no client-side pool at all; an external pooler (PgBouncer, Neon's
+#               pooled endpoint) owns the connections
+ENGINE_PROFILES = {
+    'server': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 30, 'pool_recycle': 1800,
+               'pool_pre_ping': True, 'query_cache_size': 1200},
+    'serverless': {'pool_size': 1, 'max_overflow': 2, 'pool_timeout': 10, 'pool_recycle': 300,
+                   'pool_pre_ping': True, 'query_cache_size': 500},
+    'pooler': {'poolclass': NullPool, 'pool_pre_ping': False, 'query_cache_size': 500},
+}
+
+
+class PoolMetrics:
+    """Counters fed by SQLAlchemy pool events and InstrumentedQueuePool."""
+
+    WAIT_THRESHOLD = 0.001  # Checkouts slower than this had to wait for a connection
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connects = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.waits = 0
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+            self.timeouts = 0
+
+    def record_checkout_time(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            if seconds >= self.WAIT_THRESHOLD:
+                self.waits += 1
+                self.wait_seconds += seconds
+                self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self, pool):
+        with self._lock:
+            data = {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'waits': self.waits,
+                'wait_ms_total': round(self.wait_seconds * 1000, 1),
+                'wait_ms_max': round(self.max_wait_seconds * 1000, 1),
+                'timeouts': self.timeouts,
+            }
+        data['pool_class'] = type(pool).__name__
+        if isinstance(pool, QueuePool):
+            data.update(size=pool.size(), checked_out=pool.checkedout(), overflow=max(pool.overflow(), 0))
+        return data
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            pool_metrics.record_checkout_time(time.perf_counter() - started, timed_out)
+
+
+event.listen(Pool, 'connect', lambda *args: pool_metrics.count('connects'))
+event.listen(Pool, 'checkout', lambda *args: pool_metrics.count('checkouts'))
+event.listen(Pool, 'checkin', lambda *args: pool_metrics.count('checkins'))
+
+
+# Applied to every SQLite connection. WAL lets readers proceed while place_bet()
+# writes; synchronous=NORMAL is crash-safe in WAL mode (only a power loss can drop
+# the last commits) and avoids an fsync per bet.
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': SQLITE_BUSY_TIMEOUT_MS,
+    'cache_size': -20000,  # KiB, i.e. ~20MB page cache per connection
+    'temp_store': 'MEMORY',
+    'wal_autocheckpoint': 1000,
+}
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas=SQLITE_PRAGMAS):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def _on_sqlite_connect(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        apply_sqlite_pragmas(dbapi_connection)
+
+
+event.listen(Pool, 'connect', _on_sqlite_connect)
+
+
+def engine_options(url, profile):
+    """SQLAlchemy engine options for the profile; env vars override single settings."""
+    if url.startswith('sqlite'):
+        # Python's own busy handler, so a locked database waits instead of failing
+        return {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    if not url.startswith('postgresql'):
+        return {}
+    options = dict(ENGINE_PROFILES[profile])
+    if options.get('poolclass') is not NullPool:
+        options['poolclass'] = InstrumentedQueuePool
+        for key, env in (('pool_size', 'DB_POOL_SIZE'), ('max_overflow', 'DB_MAX_OVERFLOW'),
+                         ('pool_timeout', 'DB_POOL_TIMEOUT'), ('pool_recycle', 'DB_POOL_RECYCLE')):
+            if os.environ.get(env):
+                options[key] = int(os.environ[env])
+    if os.environ.get('DB_STATEMENT_CACHE_SIZE'):
+        options['query_cache_size'] = int(os.environ['DB_STATEMENT_CACHE_SIZE'])
+    return options
+
+
+app.config['DB_ENGINE_PROFILE'] = os.environ.get('DB_ENGINE_PROFILE', 'serverless' if IS_VERCEL else 'server')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_url, app.config['DB_ENGINE_PROFILE'])
 
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
@@ -46,10 +260,227 @@ try:
 except OSError:
     pass  # May fail on read-only filesystem
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# ============== PHOTOS ==============
+
+# Uploads are stored under their content hash, so identical files dedupe to one
+# name and every photo URL is immutable. Department cards get fixed-size WebP
+# and JPEG thumbnails generated at upload time (see backfill_photos.py for old
+# uploads); names that aren't content-addressed are served as before.
+PHOTO_FORMATS = {'JPEG': 'jpg', 'MPO': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}  # MPO: multi-picture JPEG from phones and cameras
+PHOTO_MAGIC = [
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+PHOTO_SNIFF_BYTES = 12
+PHOTO_THUMB_SIZES = {'card': (480, 320)}  # 2x the 200px-high department card
+PHOTO_THUMB_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+PHOTO_MAX_AGE = 365 * 24 * 3600
+_CONTENT_ADDRESSED = re.compile(r'^([0-9a-f]{32})\.(?:jpg|png|gif|webp)$')
+_THUMBNAIL = re.compile(r'^thumbs/[0-9a-f]{32}-[a-z]+\.(?:webp|jpg)$')
+
+
+class PhotoRejected(Exception):
+    pass
+
+
+def photo_digest(photo):
+    """Content hash of a stored photo name, or None for legacy/default names."""
+    match = _CONTENT_ADDRESSED.match(photo or '')
+    return match.group(1) if match else None
+
+
+def thumbnail_name(photo, size, fmt):
+    return f"thumbs/{photo_digest(photo)}-{size}.{fmt}"
+
+
+def _write_atomic(path, write):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _write_thumbnails(image, digest):
+    from PIL import Image, ImageOps
+
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], 'thumbs')
+    os.makedirs(folder, exist_ok=True)
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    for size, dimensions in PHOTO_THUMB_SIZES.items():
+        thumb = ImageOps.fit(image, dimensions, Image.LANCZOS)
+        for ext, (fmt, options) in PHOTO_THUMB_FORMATS.items():
+            path = os.path.join(folder, f"{digest}-{size}.{ext}")
+            if os.path.exists(path):
+                continue
+            out = thumb
+            if fmt == 'JPEG' and has_alpha:
+                out = Image.new('RGB', thumb.size, (255, 255, 255))
+                out.paste(thumb, mask=thumb.getchannel('A'))
+            _write_atomic(path, lambda tmp: out.save(tmp, fmt, **options))
+
+
+def _open_photo(source):
+    from PIL import Image  # Only uploads need Pillow; keeps it off serverless cold starts
+
+    try:
+        image = Image.open(source)
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise PhotoRejected('Not a readable image') from e
+    if image.format not in PHOTO_FORMATS:
+        raise PhotoRejected(f'Unsupported image format {image.format}')
+    return image
+
+
+def store_photo(data):
+    """Store image bytes under their content hash, write thumbnails, return the photo name."""
+    image = _open_photo(io.BytesIO(data))
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    name = f"{digest}.{PHOTO_FORMATS[image.format]}"
+    path = os.path.join(app.config['UPLOAD_FOLDER'], name)
+    if not os.path.exists(path):  # Same bytes already uploaded for someone else
+        def write(tmp):
+            with open(tmp, 'wb') as f:
+                f.write(data)
+        _write_atomic(path, write)
+    _write_thumbnails(image, digest)
+    return name
+
+
+def sniff_photo_type(head):
+    """Photo extension from a file's first bytes, or None if it isn't a supported image."""
+    for magic, ext in PHOTO_MAGIC:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+class UploadStream:
+    """Where Werkzeug spools an uploaded file while parsing the form.
+
+    The type is sniffed from the first bytes and the size checked on every
+    chunk. A bad upload is dropped as soon as it is spotted and the rest of it
+    discarded, so the other form fields still parse and accept_photo_upload()
+    reports why. The bytes are hashed as they arrive into a temp file inside
+    the upload folder, which makes accepting the photo a rename.
+    """
+
+    def __init__(self, folder, max_bytes):
+        os.makedirs(folder, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=folder, suffix='.part', delete=False)
+        self.path = self._file.name
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.kind = None
+        self._head = b''
+        self._hash = hashlib.sha256()
+        self.rejected = None  # Why the upload was dropped
+
+    def _reject(self, reason, data):
+        self.rejected = reason
+        self.close()
+        return len(data)
+
+    def write(self, data):
+        if self.rejected:
+            return len(data)
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            return self._reject(f'Photos are limited to {self.max_bytes // (1024 * 1024)}MB.', data)
+        if self.kind is None and len(self._head) < PHOTO_SNIFF_BYTES:
+            self._head += data[:PHOTO_SNIFF_BYTES]
+            if len(self._head) >= PHOTO_SNIFF_BYTES:
+                self.kind = sniff_photo_type(self._head)
+                if self.kind is None:
+                    return self._reject('Photos must be JPEG, PNG, GIF or WebP images.', data)
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def seek(self, *args):
+        return 0 if self.rejected else self._file.seek(*args)
+
+    @property
+    def digest(self):
+        return self._hash.hexdigest()[:32]
+
+    def close(self):
+        self._file.close()
+        try:
+            os.remove(self.path)  # Gone already if the photo was accepted
+        except FileNotFoundError:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)  # read/seek/flush for Werkzeug and FileStorage
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadStream(os.path.join(app.config['UPLOAD_FOLDER'], '.incoming'), app.config['PHOTO_MAX_BYTES'])
+
+
+if not IS_VERCEL:  # Read-only filesystem; uploads are disabled there anyway
+    app.request_class = UploadRequest
+
+# Thumbnails are CPU-bound; a small pool keeps concurrent uploads from tying up
+# request workers, and the slot count bounds how many can wait for it.
+photo_executor = ThreadPoolExecutor(max_workers=app.config['PHOTO_WORKERS'], thread_name_prefix='photos')
+photo_slots = threading.BoundedSemaphore(app.config['PHOTO_QUEUE_LIMIT'])
+
+
+def _thumbnail_job(name):
+    path = os.path.join(app.config['UPLOAD_FOLDER'], name)
+    try:
+        _write_thumbnails(_open_photo(path), photo_digest(name))
+    except Exception as e:
+        print(f"Photo {name} could not be processed: {e}")
+        with app.app_context():
+            Candidate.query.filter_by(photo=name).update({'photo': 'default.png'})
+            db.session.commit()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    finally:
+        photo_slots.release()
+
+
+def accept_photo_upload(file):
+    """Move a streamed upload into content-addressed storage.
+
+    Returns the photo name and a callback that queues its thumbnails. Call it
+    once the candidate row is committed: a failed job resets the photo of
+    whichever candidates it finds using the name.
+    """
+    stream = file.stream
+    if isinstance(stream, UploadStream) and stream.rejected:
+        raise PhotoRejected(stream.rejected)
+    if not isinstance(stream, UploadStream) or stream.kind is None:
+        raise PhotoRejected('Photos must be JPEG, PNG, GIF or WebP images.')
+    if not photo_slots.acquire(blocking=False):
+        raise PhotoRejected('Too many photos are still processing, try again in a moment.')
+    name = f"{stream.digest}.{stream.kind}"
+    path = os.path.join(app.config['UPLOAD_FOLDER'], name)
+    try:
+        stream.flush()
+        if not os.path.exists(path):
+            os.replace(stream.path, path)
+    except Exception:
+        photo_slots.release()
+        raise
+    return name, functools.partial(photo_executor.submit, _thumbnail_job, name)
+
+
+app.jinja_env.globals.update(photo_digest=photo_digest, thumbnail_name=thumbnail_name)
 
 
 # ============== MODELS ==============
@@ -81,25 +512,48 @@ class Position(db.Model):
     positions_to_cut = db.Column(db.Integer, default=0)  # How many will be cut
     department_id = db.Column(db.Integer, db.ForeignKey('department.id'), nullable=False)
     candidates = db.relationship('Candidate', backref='position', lazy=True, cascade='all, delete-orphan')
+    pool = db.relationship('PositionPool', uselist=False, lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_position_department', 'department_id'),  # Department tree, department page
+    )
 
 
 class Candidate(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     photo = db.Column(db.String(500), default='default.png')
-    odds = db.Column(db.Float, default=2.0)  # Betting odds
+    odds = db.Column(db.Float, default=2.0)  # Betting odds, moved by the odds engine
+    base_odds = db.Column(db.Float)  # Opening odds set by the admin; the engine's prior
     bio = db.Column(db.Text)
     is_laid_off = db.Column(db.Boolean, default=False)  # Result
     position_id = db.Column(db.Integer, db.ForeignKey('position.id'), nullable=False)
     bets = db.relationship('Bet', backref='candidate', lazy=True, cascade='all, delete-orphan')
+    pool = db.relationship('CandidatePool', uselist=False, lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_candidate_position_laid_off', 'position_id', 'is_laid_off'),  # Positions, cut counts
+    )
 
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    coins = db.Column(db.Integer, default=1000)  # Starting coins
+    coins = db.Column(db.Integer, default=1000, index=True)  # Starting coins
     bets = db.relationship('Bet', backref='user', lazy=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bet counters, maintained by place_bet_atomic() and settlement (see recompute_user_stats)
+    bets_placed = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    bets_won = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    bets_pending = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    total_staked = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    total_won = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    pending_exposure = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # Coins in open bets
+    balance_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # ETag for /api/user
+
+    @property
+    def net_coins(self):
+        return self.total_won - self.total_staked
 
 
 class Bet(db.Model):
@@ -112,17 +566,1660 @@ class Bet(db.Model):
     won = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_bet_user_created', 'user_id', 'created_at'),  # Bet history, newest first
+        # Settlement, pools; also covers the what-if report's columns so it never touches the table
+        db.Index('ix_bet_candidate_resolved', 'candidate_id', 'is_resolved', 'user_id', 'amount', 'odds_at_bet'),
+    )
+
+
+class CandidatePool(db.Model):
+    """Betting totals for one candidate, maintained on bet placement and settlement."""
+    candidate_id = db.Column(db.Integer, db.ForeignKey('candidate.id'), primary_key=True)
+    bet_count = db.Column(db.Integer, default=0, nullable=False)
+    total_staked = db.Column(db.Integer, default=0, nullable=False)
+    liability = db.Column(db.Integer, default=0, nullable=False)  # Payout owed if every open bet wins
+
+
+class PositionPool(db.Model):
+    """Betting totals across all candidates of one position."""
+    position_id = db.Column(db.Integer, db.ForeignKey('position.id'), primary_key=True)
+    bet_count = db.Column(db.Integer, default=0, nullable=False)
+    total_staked = db.Column(db.Integer, default=0, nullable=False)
+    liability = db.Column(db.Integer, default=0, nullable=False)
+
+
+class AppMeta(db.Model):
+    """Key/value markers about the database itself (e.g. schema_version)."""
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.String(200))
+
+
+class SettlementJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)  # See SETTLEMENT_KINDS
+    target_id = db.Column(db.Integer, nullable=False)  # Candidate or Position id
+    status = db.Column(db.String(20), default='queued')  # queued, running, done, failed
+    total = db.Column(db.Integer, default=0)  # Bets to process
+    processed = db.Column(db.Integer, default=0)
+    coins = db.Column(db.Integer, default=0)  # Coins paid out (or clawed back)
+    shortfall = db.Column(db.Integer, default=0)  # Clawed-back winnings users had already spent
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime)  # Refreshed by the worker after every batch
+    finished_at = db.Column(db.DateTime)
+
+    @property
+    def progress(self):
+        return 100 if not self.total else int(100 * self.processed / self.total)
+
+
+class LedgerEntry(db.Model):
+    """One coin movement for a user; rows are only ever appended (see LEDGER)."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    amount = db.Column(db.Integer, nullable=False)  # Signed: debits are negative
+    kind = db.Column(db.String(20), nullable=False)  # See LEDGER_KINDS
+    bet_id = db.Column(db.Integer)  # No foreign key: entries outlive deleted bets
+    note = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_ledger_user_entry', 'user_id', 'id'),  # A user's entries after their snapshot
+    )
+
+
+class BalanceSnapshot(db.Model):
+    """A user's balance as of a ledger entry; coins = snapshot + later entries."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    coins = db.Column(db.Integer, nullable=False)
+    last_entry_id = db.Column(db.Integer, default=0, nullable=False)  # Entries up to this id are included
+    taken_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class IdempotencyKey(db.Model):
+    """The response to a keyed /bet request, replayed when the key is sent again."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    fingerprint = db.Column(db.String(100), nullable=False)  # The request first made with this key
+    response = db.Column(db.Text, nullable=False)  # JSON body
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_user_key'),
+        db.Index('ix_idempotency_created', 'created_at'),  # Expiry
+    )
+
 
 @login_manager.user_loader
 def load_user(user_id):
     return Admin.query.get(int(user_id))
 
 
+# ============== QUERIES ==============
+
+def load_department_tree(with_candidate_counts=False):
+    """Load all departments with their positions in a fixed number of queries.
+
+    Positions are eager-loaded with a single SELECT ... IN, and candidate counts
+    (when requested) come from one grouped aggregate instead of walking
+    pos.candidates per position.
+    """
+    departments = Department.query.options(selectinload(Department.positions)).all()
+    positions = [p for d in departments for p in d.positions]
+
+    candidate_counts = {}
+    if with_candidate_counts:
+        candidate_counts = dict(
+            db.session.query(Position.department_id, func.count(Candidate.id))
+            .join(Candidate, Candidate.position_id == Position.id)
+            .group_by(Position.department_id)
+            .all()
+        )
+
+    return {
+        'departments': departments,
+        'candidate_counts': candidate_counts,
+        'total_employees': sum(p.total_employees or 0 for p in positions),
+        'total_to_cut': sum(p.positions_to_cut or 0 for p in positions),
+    }
+
+
+def load_bet_history(user_id, before=None, limit=None):
+    """Return one page of a user's bets, newest first, with candidate/position names.
+
+    Keyset-paginated on (created_at, id) so every page is a range scan of
+    ix_bet_user_created. `before` is the cursor returned with the previous page.
+    """
+    limit = limit or app.config['BET_HISTORY_PAGE_SIZE']
+    query = db.session.query(
+        Bet.id, Bet.amount, Bet.odds_at_bet, Bet.is_resolved, Bet.won, Bet.created_at,
+        Candidate.name.label('candidate_name'), Position.title.label('position_title'),
+    ).join(Candidate, Bet.candidate_id == Candidate.id) \
+        .join(Position, Candidate.position_id == Position.id) \
+        .filter(Bet.user_id == user_id)
+
+    if before:
+        try:
+            created_at, bet_id = before.rsplit('_', 1)
+            created_at, bet_id = datetime.fromisoformat(created_at), int(bet_id)
+            query = query.filter(db.or_(Bet.created_at < created_at,
+                                        and_(Bet.created_at == created_at, Bet.id < bet_id)))
+        except ValueError:
+            pass  # Bad cursor: start from the newest page
+
+    bets = query.order_by(Bet.created_at.desc(), Bet.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(bets) > limit:
+        bets = bets[:limit]
+        next_cursor = f"{bets[-1].created_at.isoformat()}_{bets[-1].id}"
+    return bets, next_cursor
+
+
+# ============== LEADERBOARD ==============
+
+LeaderboardEntry = namedtuple('LeaderboardEntry', 'rank id username coins')
+
+
+class Leaderboard:
+    """In-memory ranking of users by coins, kept current as balances change.
+
+    Keys are (-coins, id) in a sorted list, so the top N is a slice and a
+    user's rank is a bisect. Bet placement and settlement push new balances in;
+    a full reload from the coins index happens only on first use, after TTL
+    (to pick up writes from other worker processes) or when a user is unknown.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._users = {}  # id -> (username, coins)
+        self._loaded_at = None
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > app.config['LEADERBOARD_TTL']:
+            self.reload()
+
+    def reload(self):
+        rows = db.session.query(User.id, User.username, User.coins).all()
+        with self._lock:
+            self._users = {user_id: (username, coins or 0) for user_id, username, coins in rows}
+            self._keys = sorted((-coins, user_id) for user_id, (_, coins) in self._users.items())
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def add(self, user_id, username, coins):
+        user_id, coins = int(user_id), int(coins or 0)
+        with self._lock:
+            if user_id in self._users:
+                self._keys.remove((-self._users[user_id][1], user_id))
+            self._users[user_id] = (username, coins)
+            bisect.insort(self._keys, (-coins, user_id))
+
+    def update(self, balances):
+        """Apply (user_id, coins) pairs; unknown users trigger a reload on next read."""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for user_id, coins in balances:
+                # Ids may arrive as strings (JSON, event payloads); keys are ints
+                user_id, coins = int(user_id), int(coins or 0)
+                if user_id not in self._users:
+                    self._loaded_at = None
+                    continue
+                username, old_coins = self._users[user_id]
+                del self._keys[bisect.bisect_left(self._keys, (-old_coins, user_id))]
+                bisect.insort(self._keys, (-coins, user_id))
+                self._users[user_id] = (username, coins)
+
+    def top(self, n=50):
+        self._ensure_loaded()
+        with self._lock:
+            entries = []
+            for position, (neg_coins, user_id) in enumerate(self._keys[:n], 1):
+                rank = entries[-1].rank if entries and entries[-1].coins == -neg_coins else position
+                entries.append(LeaderboardEntry(rank, user_id, self._users[user_id][0], -neg_coins))
+            return entries
+
+    def _rank(self, coins):
+        # Users tied on coins share a rank
+        return bisect.bisect_left(self._keys, (-coins,)) + 1
+
+    def rank(self, user_id):
+        self._ensure_loaded()
+        with self._lock:
+            if user_id not in self._users:
+                return None
+            return self._rank(self._users[user_id][1])
+
+
+leaderboard_cache = Leaderboard()
+
+
+# ============== PAGE CACHE ==============
+
+class MemoryPageCache:
+    """Per-process LRU of rendered pages with a TTL per entry."""
+
+    def __init__(self, max_entries):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, body)
+        self.max_entries = max_entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, body, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class FilesystemPageCache:
+    """Rendered pages stored as files, so every worker on the host shares hits
+    and invalidations. Files are written atomically and expire by TTL."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                expires_at = float(f.readline())
+                if expires_at < time.time():
+                    return None
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, body, ttl):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(f"{time.time() + ttl}\n")
+                f.write(body)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # A cache that cannot write just misses
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+def _make_page_cache():
+    backend = app.config['PAGE_CACHE_BACKEND']
+    if backend == 'filesystem':
+        try:
+            return FilesystemPageCache(app.config['PAGE_CACHE_DIR'])
+        except OSError:
+            print("Page cache directory not writable, falling back to memory")
+    if backend == 'none':
+        return None
+    return MemoryPageCache(app.config['PAGE_CACHE_SIZE'])
+
+
+page_cache = _make_page_cache()
+
+
+def cached_page(view):
+    """Serve a public view's rendered HTML from page_cache, keyed by endpoint and args.
+
+    Admins and requests with pending flash messages bypass the cache, since
+    base.html renders both into the page.
+    """
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+        if page_cache is None or current_user.is_authenticated or session.get('_flashes'):
+            return view(**kwargs)
+        key = page_cache_key(request.endpoint, **kwargs)
+        body = page_cache.get(key)
+        if body is None:
+            body = view(**kwargs)
+            page_cache.set(key, body, app.config['PAGE_CACHE_TTL'])
+        return body
+    return wrapper
+
+
+def page_cache_key(endpoint, id=None):
+    return endpoint if id is None else f"{endpoint}:{id}"
+
+
+def invalidate_pages(*keys):
+    if page_cache is None:
+        return
+    for key in keys:
+        page_cache.delete(key)
+
+
+def invalidate_department_pages(*department_ids):
+    """Drop the home page and the given departments' pages after an admin change."""
+    invalidate_pages('index', *(page_cache_key('department_view', dept_id) for dept_id in department_ids))
+
+
+# ============== LIVE EVENTS ==============
+
+class EventBroker:
+    """In-process pub/sub feeding the /events server-sent event stream.
+
+    Events go into one shared ring buffer with increasing sequence numbers and
+    every listener waits on a single Condition, so an idle subscriber costs a
+    cursor rather than a queue. Under a cooperative server (e.g. gunicorn with
+    gevent workers) threading is patched to greenlets and thousands of idle
+    streams fit in one worker without a thread per client.
+    """
+
+    def __init__(self, history=1000):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=history)  # (seq, channel, event, data)
+        self._seq = 0
+
+    def publish(self, channel, event, data):
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, channel, event, json.dumps(data)))
+            self._cond.notify_all()
+
+    def _since(self, last_seq):
+        """Events after last_seq, or None if some have already left the buffer."""
+        if last_seq >= self._seq:
+            return []
+        first_seq = self._events[0][0]
+        if last_seq + 1 < first_seq:
+            return None
+        return list(itertools.islice(self._events, last_seq + 1 - first_seq, None))
+
+    def listen(self, channels, last_seq=None, timeout=15):
+        """Yield (seq, event, data) for the channels; None after `timeout` idle seconds.
+
+        A listener that fell behind the buffer (or reconnects with an id from
+        a previous process) gets a 'resync' event telling it to refetch.
+        """
+        with self._cond:
+            if last_seq is None or last_seq > self._seq:
+                last_seq = self._seq
+        while True:
+            with self._cond:
+                if last_seq >= self._seq:
+                    self._cond.wait(timeout)
+                pending = self._since(last_seq)
+                last_seq = self._seq
+            if pending is None:
+                yield last_seq, 'resync', '{}'
+            elif not pending:
+                yield None
+            for seq, channel, event, data in pending or ():
+                if channel in channels:
+                    yield seq, event, data
+
+
+event_broker = EventBroker()
+
+
+def publish_balances(balances):
+    for user_id, coins in balances:
+        event_broker.publish(f'user:{user_id}', 'balance', {'user_id': user_id, 'coins': coins})
+
+
+# ============== BETTING ==============
+
+# Most bets one /bet/batch request may place
+BET_BATCH_MAX = 100
+
+
+class BetRejected(Exception):
+    """Raised when a bet cannot be placed; the message is shown to the user."""
+
+
+BETTING_CLOSED_MESSAGE = 'Betting is closed: every cut for this position has been made 🔒'
+
+
+def position_takes_bets():
+    """SQL condition on Candidate: their position still has cuts to make (see position_cuts_exhausted)."""
+    laid_off = aliased(Candidate)
+    laid_off_count = select(func.count(laid_off.id)) \
+        .where(laid_off.position_id == Position.id, laid_off.is_laid_off.is_(True)).scalar_subquery()
+    return select(Position.id).where(
+        Position.id == Candidate.position_id,
+        db.or_(func.coalesce(Position.positions_to_cut, 0) == 0, laid_off_count < Position.positions_to_cut),
+    ).exists()
+
+
+def place_bet_atomic(user_id, candidate_id, amount):
+    """Debit the user and record a bet without a read-check-write race.
+
+    The balance check, the debit and the read of the candidate's odds happen in
+    one conditional UPDATE ... RETURNING, so concurrent requests from the same
+    user can never overdraw (Postgres row-locks the user row, SQLite serializes
+    the write). The bet row and its ledger debit are added to the session; the
+    caller commits.
+    """
+    if amount <= 0:
+        raise BetRejected('Bet amount must be positive')
+
+    open_candidate = and_(Candidate.id == candidate_id, Candidate.is_laid_off.isnot(True), position_takes_bets())
+    odds_sq = select(Candidate.odds).where(open_candidate).scalar_subquery()
+    name_sq = select(Candidate.name).where(open_candidate).scalar_subquery()
+    position_sq = select(Candidate.position_id).where(open_candidate).scalar_subquery()
+
+    row = db.session.execute(
+        update(User)
+        .where(User.id == user_id, User.coins >= amount, select(Candidate.id).where(open_candidate).exists())
+        .values(
+            coins=User.coins - amount,
+            bets_placed=User.bets_placed + 1,
+            bets_pending=User.bets_pending + 1,
+            total_staked=User.total_staked + amount,
+            pending_exposure=User.pending_exposure + amount,
+            balance_version=User.balance_version + 1,
+        )
+        .returning(User.coins, odds_sq, name_sq, position_sq)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+    if row is None:
+        # Only the failure path pays for a second query to explain the refusal
+        coins = db.session.query(User.coins).filter_by(id=user_id).scalar()
+        candidate = db.session.get(Candidate, candidate_id)
+        if coins is None or candidate is None:
+            raise BetRejected('Invalid user or candidate')
+        if candidate.is_laid_off:
+            raise BetRejected('Too late! They are already gone! 💀')
+        if position_cuts_exhausted(candidate.position):
+            raise BetRejected(BETTING_CLOSED_MESSAGE)
+        raise BetRejected('Not enough coins! You are as broke as the company! 💸')
+
+    remaining_coins, odds, candidate_name, position_id = row
+    bet = Bet(user_id=user_id, candidate_id=candidate_id, amount=amount, odds_at_bet=odds)
+    db.session.add(bet)
+    db.session.flush()  # The ledger entry needs the bet id
+    record_ledger(user_id, -amount, 'bet', bet_id=bet.id)
+    bump_pools(candidate_id, position_id, bets=1, staked=amount, liability=int(amount * odds))
+    return {
+        'bet': bet,
+        'candidate_name': candidate_name,
+        'remaining_coins': remaining_coins,
+        'potential_win': int(amount * odds),
+        'position_id': position_id,
+    }
+
+
+def place_bets_atomic(user_id, items):
+    """Debit the user once for a list of bets and record them together.
+
+    `items` are (candidate_id, amount) pairs. An item with a bad amount or a
+    closed or unknown candidate is refused on its own; the rest are checked
+    against the balance as a whole and either all placed or all refused. The
+    debit is one conditional UPDATE that also re-checks that every candidate
+    is still open, and the bets, their ledger debits and each pool table take
+    one multi-row INSERT apiece, whatever the batch size. Returns per-item
+    results (in order), the remaining coins and the positions touched; the
+    caller commits.
+    """
+    candidates = {row.id: row for row in db.session.execute(
+        select(Candidate.id, Candidate.name, Candidate.odds, Candidate.position_id, Candidate.is_laid_off,
+               position_takes_bets().label('position_open'))
+        .where(Candidate.id.in_({candidate_id for candidate_id, _ in items}))
+    )}
+    results, accepted = [], []
+    for candidate_id, amount in items:
+        candidate = candidates.get(candidate_id)
+        result = {'candidate_id': candidate_id, 'amount': amount, 'success': False}
+        if amount <= 0:
+            result['message'] = 'Bet amount must be positive'
+        elif candidate is None:
+            result['message'] = 'Invalid candidate'
+        elif candidate.is_laid_off:
+            result['message'] = 'Too late! They are already gone! 💀'
+        elif not candidate.position_open:
+            result['message'] = BETTING_CLOSED_MESSAGE
+        else:
+            result.update(success=True, candidate_name=candidate.name,
+                          potential_win=int(amount * candidate.odds))
+            accepted.append((result, candidate))
+        results.append(result)
+    if not accepted:
+        return results, None, set()
+
+    total = sum(result['amount'] for result, _ in accepted)
+    open_ids = {candidate.id for _, candidate in accepted}
+    still_open = select(func.count(Candidate.id)) \
+        .where(Candidate.id.in_(open_ids), Candidate.is_laid_off.isnot(True), position_takes_bets()).scalar_subquery()
+    remaining_coins = db.session.execute(
+        update(User)
+        .where(User.id == user_id, User.coins >= total, still_open == len(open_ids))
+        .values(
+            coins=User.coins - total,
+            bets_placed=User.bets_placed + len(accepted),
+            bets_pending=User.bets_pending + len(accepted),
+            total_staked=User.total_staked + total,
+            pending_exposure=User.pending_exposure + total,
+            balance_version=User.balance_version + 1,
+        )
+        .returning(User.coins)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if remaining_coins is None:
+        coins = db.session.query(User.coins).filter_by(id=user_id).scalar()
+        if coins is None:
+            raise BetRejected('Invalid user or candidate')
+        if coins >= total:
+            raise BetRejected('Someone was just laid off! Check the board and try again 💀')
+        raise BetRejected(f'Not enough coins for {total} in bets! You are as broke as the company! 💸')
+
+    # Without an ORDER guarantee for RETURNING across backends, ids are matched
+    # back by (candidate, amount); bets that share both are interchangeable
+    now = datetime.utcnow()
+    inserted = db.session.execute(
+        insert(Bet).returning(Bet.id, Bet.candidate_id, Bet.amount),
+        [{'user_id': user_id, 'candidate_id': candidate.id, 'amount': result['amount'],
+          'odds_at_bet': candidate.odds, 'is_resolved': False, 'won': False, 'created_at': now}
+         for result, candidate in accepted],
+    ).all()
+    db.session.execute(insert(LedgerEntry), [
+        {'user_id': user_id, 'amount': -amount, 'kind': 'bet', 'bet_id': bet_id, 'created_at': now}
+        for bet_id, _, amount in inserted
+    ])
+    bet_ids = {}
+    for bet_id, candidate_id, amount in sorted(inserted):
+        bet_ids.setdefault((candidate_id, amount), deque()).append(bet_id)
+    for result, candidate in accepted:
+        result['bet_id'] = bet_ids[candidate.id, result['amount']].popleft()
+
+    by_candidate, by_position = {}, {}
+    for result, candidate in accepted:
+        for pools, key in ((by_candidate, candidate.id), (by_position, candidate.position_id)):
+            bets, staked, liability = pools.get(key, (0, 0, 0))
+            pools[key] = (bets + 1, staked + result['amount'], liability + result['potential_win'])
+    _upsert_pool(CandidatePool, CandidatePool.candidate_id, by_candidate)
+    _upsert_pool(PositionPool, PositionPool.position_id, by_position)
+    return results, remaining_coins, set(by_position)
+
+
+def dialect_insert(model):
+    """INSERT supporting ON CONFLICT for the active backend (imported lazily for cold starts)."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(model)
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    return sqlite_insert(model)
+
+
+def _upsert_pool(model, key_column, totals):
+    """Add {key: (bets, staked, liability)} to the pool rows, creating them if needed, in one statement."""
+    stmt = dialect_insert(model).values([
+        {key_column.key: key, 'bet_count': bets, 'total_staked': staked, 'liability': liability}
+        for key, (bets, staked, liability) in totals.items()
+    ])
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[key_column],
+        set_={
+            'bet_count': model.bet_count + stmt.excluded.bet_count,
+            'total_staked': model.total_staked + stmt.excluded.total_staked,
+            'liability': model.liability + stmt.excluded.liability,
+        },
+    ))
+
+
+def bump_pools(candidate_id, position_id, bets=0, staked=0, liability=0):
+    """Add to a candidate's and its position's pool rows, creating them if needed."""
+    _upsert_pool(CandidatePool, CandidatePool.candidate_id, {candidate_id: (bets, staked, liability)})
+    _upsert_pool(PositionPool, PositionPool.position_id, {position_id: (bets, staked, liability)})
+
+
+def recompute_betting_pools():
+    """Rebuild all candidate and position pools from the Bet table."""
+    open_liability = func.sum(db.case((Bet.is_resolved.isnot(True), payout_expr()), else_=0))
+    db.session.execute(delete(CandidatePool))
+    db.session.execute(delete(PositionPool))
+    db.session.execute(insert(CandidatePool).from_select(
+        ['candidate_id', 'bet_count', 'total_staked', 'liability'],
+        select(Bet.candidate_id, func.count(Bet.id), func.sum(Bet.amount), open_liability)
+        .group_by(Bet.candidate_id)
+    ))
+    db.session.execute(insert(PositionPool).from_select(
+        ['position_id', 'bet_count', 'total_staked', 'liability'],
+        select(Candidate.position_id, func.count(Bet.id), func.sum(Bet.amount), open_liability)
+        .join(Candidate, Bet.candidate_id == Candidate.id)
+        .group_by(Candidate.position_id)
+    ))
+    db.session.commit()
+
+
+def payout_expr():
+    """SQL for int(bet.amount * bet.odds_at_bet), matching Python truncation.
+
+    Postgres rounds when casting a float to integer, so floor explicitly there;
+    SQLite's CAST already truncates (payouts are never negative).
+    """
+    product = Bet.amount * Bet.odds_at_bet
+    if db.engine.dialect.name == 'postgresql':
+        product = func.floor(product)
+    return cast(product, Integer)
+
+
+def _bet_totals(*criteria):
+    count, coins = db.session.query(func.count(Bet.id), func.coalesce(func.sum(payout_expr()), 0)) \
+        .filter(*criteria).one()
+    return {'bets': count, 'coins': int(coins)}
+
+
+def _apply_to_bets(criteria, values, coin_sign=0, resolve_sign=0, limit=None):
+    """Apply one set-based settlement step to the bets matching criteria.
+
+    Per-user sums of the matching bets are computed once and applied in a
+    single UPDATE ... FROM: coins and win counters move by coin_sign (1 pays
+    out, -1 claws back) and pending counters by resolve_sign (1 resolves, -1
+    reopens). Coin moves get a ledger entry per bet, and the bets then get
+    `values` in one more UPDATE. With `limit`, only the next batch of matching
+    bets is touched. A clawback never takes a balance below zero: winnings
+    already spent are recorded as a shortfall (and a ledger adjustment). Returns
+    the number of bets, coins affected and shortfall plus the new (user_id,
+    coins) balances; the caller commits.
+    """
+    if limit:
+        ids = [bet_id for bet_id, in db.session.query(Bet.id).filter(*criteria).order_by(Bet.id).limit(limit)]
+        if not ids:
+            return {'bets': 0, 'coins': 0, 'shortfall': 0, 'balances': []}
+        criteria = tuple(criteria) + (Bet.id.in_(ids),)  # Re-runs skip rows already settled
+
+    totals = _bet_totals(*criteria)
+    totals['balances'] = []
+    totals['shortfall'] = 0
+    if not totals['bets']:
+        return totals
+    if not coin_sign:
+        totals['coins'] = 0  # Bets close as lost; no coins move
+
+    per_user = select(
+        Bet.user_id.label('user_id'),
+        func.count(Bet.id).label('bets'),
+        func.sum(Bet.amount).label('staked'),
+        func.sum(payout_expr()).label('winnings'),
+    ).where(*criteria).group_by(Bet.user_id).subquery()
+    coins = User.coins + coin_sign * per_user.c.winnings
+    shortfalls = []
+    if coin_sign < 0:
+        balance = func.coalesce(User.coins, 0)
+        shortfalls = db.session.execute(
+            select(User.id, per_user.c.winnings - balance)
+            .where(User.id == per_user.c.user_id, balance < per_user.c.winnings)
+        ).all()
+        coins = db.case((balance >= per_user.c.winnings, coins), else_=0)
+    totals['balances'] = db.session.execute(
+        update(User)
+        .where(User.id == per_user.c.user_id)
+        .values(
+            coins=coins,
+            bets_won=User.bets_won + coin_sign * per_user.c.bets,
+            total_won=User.total_won + coin_sign * per_user.c.winnings,
+            bets_pending=User.bets_pending - resolve_sign * per_user.c.bets,
+            pending_exposure=User.pending_exposure - resolve_sign * per_user.c.staked,
+            balance_version=User.balance_version + 1,
+        )
+        .returning(User.id, User.coins)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if resolve_sign:
+        # Resolved bets leave the open liability; reopened ones come back
+        per_candidate = select(
+            Bet.candidate_id.label('candidate_id'), func.sum(payout_expr()).label('payout'),
+        ).where(*criteria).group_by(Bet.candidate_id).subquery()
+        db.session.execute(
+            update(CandidatePool)
+            .where(CandidatePool.candidate_id == per_candidate.c.candidate_id)
+            .values(liability=CandidatePool.liability - resolve_sign * per_candidate.c.payout)
+            .execution_options(synchronize_session=False)
+        )
+        per_position = select(
+            Candidate.position_id.label('position_id'), func.sum(payout_expr()).label('payout'),
+        ).join(Candidate, Bet.candidate_id == Candidate.id).where(*criteria) \
+            .group_by(Candidate.position_id).subquery()
+        db.session.execute(
+            update(PositionPool)
+            .where(PositionPool.position_id == per_position.c.position_id)
+            .values(liability=PositionPool.liability - resolve_sign * per_position.c.payout)
+            .execution_options(synchronize_session=False)
+        )
+    if coin_sign:
+        record_bet_ledger(criteria, coin_sign)
+    if shortfalls:
+        db.session.execute(insert(LedgerEntry), [
+            {'user_id': user_id, 'amount': shortfall, 'kind': 'adjustment',
+             'note': 'Clawback shortfall: winnings already spent', 'created_at': datetime.utcnow()}
+            for user_id, shortfall in shortfalls
+        ])
+        totals['shortfall'] = sum(shortfall for _, shortfall in shortfalls)
+    db.session.execute(
+        update(Bet).where(*criteria).values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    return totals
+
+
+def _open_position_candidates(position_id):
+    return select(Candidate.id).where(Candidate.position_id == position_id, Candidate.is_laid_off.isnot(True)) \
+        .correlate(None)
+
+
+# kind -> steps of (bet criteria for the target, values to set, coin direction, resolve direction)
+SETTLEMENT_KINDS = {
+    'candidate_layoff': (
+        # Candidate laid off: open bets on them win
+        (lambda cid: (Bet.candidate_id == cid, Bet.is_resolved.isnot(True)),
+         {'is_resolved': True, 'won': True}, 1, 1),
+        # ...and so do bets already closed as lost when their position ran out of cuts
+        (lambda cid: (Bet.candidate_id == cid, Bet.is_resolved.is_(True), Bet.won.isnot(True)),
+         {'won': True}, 1, 0),
+    ),
+    # Layoff undone: claw back winnings and reopen the bets (position settlement recloses them)
+    'candidate_reset': (
+        (lambda cid: (Bet.candidate_id == cid, Bet.is_resolved.is_(True), Bet.won.is_(True)),
+         {'is_resolved': False, 'won': False}, -1, -1),
+    ),
+    # All cuts for a position used up: open bets on everyone still employed lose
+    'position_close': (
+        (lambda pid: (Bet.candidate_id.in_(_open_position_candidates(pid)), Bet.is_resolved.isnot(True)),
+         {'is_resolved': True, 'won': False}, 0, 1),
+    ),
+    # Position has cuts left again: reopen the bets that were closed as lost
+    'position_reopen': (
+        (lambda pid: (Bet.candidate_id.in_(_open_position_candidates(pid)),
+                      Bet.is_resolved.is_(True), Bet.won.isnot(True)),
+         {'is_resolved': False, 'won': False}, 0, -1),
+    ),
+}
+
+
+def settlement_criteria(kind, target_id):
+    """Bet criteria of each step of a SETTLEMENT_KINDS kind."""
+    return [criteria(target_id) for criteria, _, _, _ in SETTLEMENT_KINDS[kind]]
+
+
+def apply_settlement(kind, target_id, limit=None):
+    """Run the steps of the given SETTLEMENT_KINDS kind, at most `limit` bets in all."""
+    totals = {'bets': 0, 'coins': 0, 'shortfall': 0}
+    balances = {}
+    for criteria, values, coin_sign, resolve_sign in SETTLEMENT_KINDS[kind]:
+        step = _apply_to_bets(criteria(target_id), values, coin_sign, resolve_sign,
+                              limit and limit - totals['bets'])
+        for key in totals:
+            totals[key] += step[key]
+        balances.update(step['balances'])
+        if limit and totals['bets'] >= limit:
+            break
+    totals['balances'] = list(balances.items())
+    return totals
+
+
+def settle_candidate_bets(candidate_id, limit=None):
+    """Pay out open bets on a laid-off candidate."""
+    return apply_settlement('candidate_layoff', candidate_id, limit)
+
+
+def reverse_candidate_bets(candidate_id, limit=None):
+    """Undo settle_candidate_bets(): claw back winnings and reopen the bets."""
+    return apply_settlement('candidate_reset', candidate_id, limit)
+
+
+def recompute_user_stats(user_ids=None):
+    """Rebuild every user's bet counters from the Bet table in bulk.
+
+    One grouped pass over Bet feeds a single UPDATE ... FROM for users with
+    bets; users without any are zeroed by a second UPDATE. With user_ids only
+    those users are rebuilt (e.g. after some of their bets were deleted).
+    """
+    if user_ids is not None and not user_ids:
+        return 0
+    scope = () if user_ids is None else (User.id.in_(user_ids),)
+    per_user = select(
+        Bet.user_id.label('user_id'),
+        func.count(Bet.id).label('placed'),
+        func.sum(db.case((Bet.won.is_(True), 1), else_=0)).label('won'),
+        func.sum(db.case((Bet.is_resolved.isnot(True), 1), else_=0)).label('pending'),
+        func.sum(Bet.amount).label('staked'),
+        func.sum(db.case((Bet.won.is_(True), payout_expr()), else_=0)).label('winnings'),
+        func.sum(db.case((Bet.is_resolved.isnot(True), Bet.amount), else_=0)).label('exposure'),
+    ).where(*(() if user_ids is None else (Bet.user_id.in_(user_ids),))).group_by(Bet.user_id).subquery()
+
+    db.session.execute(
+        update(User)
+        .where(~select(Bet.id).where(Bet.user_id == User.id).exists(), *scope)
+        .values(bets_placed=0, bets_won=0, bets_pending=0, total_staked=0, total_won=0, pending_exposure=0)
+        .execution_options(synchronize_session=False)
+    )
+    result = db.session.execute(
+        update(User)
+        .where(User.id == per_user.c.user_id)
+        .values(
+            bets_placed=per_user.c.placed,
+            bets_won=per_user.c.won,
+            bets_pending=per_user.c.pending,
+            total_staked=per_user.c.staked,
+            total_won=per_user.c.winnings,
+            pending_exposure=per_user.c.exposure,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def bettor_ids(*criteria):
+    """Users holding bets that match criteria (joins Candidate and Position for filters on them)."""
+    query = db.session.query(Bet.user_id).join(Candidate, Bet.candidate_id == Candidate.id) \
+        .join(Position, Candidate.position_id == Position.id).filter(*criteria).distinct()
+    return [user_id for user_id, in query]
+
+
+def position_cuts_exhausted(position):
+    laid_off = Candidate.query.filter_by(position_id=position.id, is_laid_off=True).count()
+    return bool(position.positions_to_cut) and laid_off >= position.positions_to_cut
+
+
+# ============== LEDGER ==============
+
+# Every change to User.coins appends a LedgerEntry in the same transaction:
+# a debit per bet, a credit per payout (or debit per clawback), a grant for
+# new users and admin adjustments. BalanceSnapshot holds each user's balance
+# as of an entry id, so a balance is rebuilt from the snapshot plus the tail
+# of entries after it, and the reconciliation is one grouped query. Entries
+# are never updated or deleted.
+LEDGER_KINDS = ('grant', 'bet', 'payout', 'clawback', 'adjustment')
+
+
+def record_ledger(user_id, amount, kind, bet_id=None, note=None):
+    """Append one entry to the session; the caller commits it with the balance change."""
+    db.session.add(LedgerEntry(user_id=user_id, amount=amount, kind=kind, bet_id=bet_id, note=note))
+
+
+def record_bet_ledger(criteria, coin_sign):
+    """Append a payout (or clawback) entry for each bet matching criteria, in one INSERT ... SELECT."""
+    db.session.execute(insert(LedgerEntry).from_select(
+        ['user_id', 'amount', 'kind', 'bet_id', 'created_at'],
+        select(Bet.user_id, coin_sign * payout_expr(), db.literal('payout' if coin_sign > 0 else 'clawback'),
+               Bet.id, db.literal(datetime.utcnow())).where(*criteria)
+    ))
+
+
+def adjust_coins(user_id, amount, note):
+    """Credit (or debit) a user by hand; returns the new balance, or None for an unknown user."""
+    coins = db.session.execute(
+        update(User).where(User.id == user_id)
+        .values(coins=User.coins + amount, balance_version=User.balance_version + 1)
+        .returning(User.coins)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if coins is not None:
+        record_ledger(user_id, amount, 'adjustment', note=note)
+    return coins
+
+
+def _ledger_tail(cutoff=None):
+    """Per-user sum and count of the entries after their snapshot (up to entry id `cutoff`)."""
+    query = select(
+        LedgerEntry.user_id.label('user_id'),
+        func.sum(LedgerEntry.amount).label('amount'),
+        func.count(LedgerEntry.id).label('entries'),
+    ).outerjoin(BalanceSnapshot, BalanceSnapshot.user_id == LedgerEntry.user_id) \
+        .where(LedgerEntry.id > func.coalesce(BalanceSnapshot.last_entry_id, 0))
+    if cutoff is not None:
+        query = query.where(LedgerEntry.id <= cutoff)
+    return query.group_by(LedgerEntry.user_id)
+
+
+def ledger_balance(user_id):
+    """A user's balance rebuilt from their snapshot and the entries since."""
+    snapshot = db.session.get(BalanceSnapshot, user_id)
+    start = snapshot.last_entry_id if snapshot else 0
+    tail = db.session.query(func.coalesce(func.sum(LedgerEntry.amount), 0)) \
+        .filter(LedgerEntry.user_id == user_id, LedgerEntry.id > start).scalar()
+    return (snapshot.coins if snapshot else 0) + int(tail)
+
+
+def _upsert_snapshots(rows, add=False):
+    """Insert or replace snapshots from a SELECT of (user_id, coins, last_entry_id, taken_at).
+
+    The SELECT needs a WHERE clause: SQLite cannot tell an upsert's ON CONFLICT
+    from a join's ON without one.
+    """
+    stmt = dialect_insert(BalanceSnapshot).from_select(['user_id', 'coins', 'last_entry_id', 'taken_at'], rows)
+    return db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[BalanceSnapshot.user_id],
+        set_={
+            'coins': BalanceSnapshot.coins + stmt.excluded.coins if add else stmt.excluded.coins,
+            'last_entry_id': stmt.excluded.last_entry_id,
+            'taken_at': stmt.excluded.taken_at,
+        },
+    ))
+
+
+def snapshot_balances():
+    """Roll every user's snapshot forward over their settled ledger tail; returns users updated.
+
+    Only entries older than LEDGER_SNAPSHOT_LAG are folded in, so a transaction
+    that took an entry id but has not committed yet is never skipped over.
+    """
+    cutoff = db.session.query(func.max(LedgerEntry.id)).filter(
+        LedgerEntry.created_at < datetime.utcnow() - timedelta(seconds=app.config['LEDGER_SNAPSHOT_LAG'])
+    ).scalar()
+    if not cutoff:
+        return 0
+    tail = _ledger_tail(cutoff).subquery()
+    result = _upsert_snapshots(select(tail.c.user_id, tail.c.amount, db.literal(cutoff),
+                                      db.literal(datetime.utcnow())).where(db.true()), add=True)
+    db.session.commit()
+    return result.rowcount
+
+
+def adopt_balances():
+    """Take every user's current coins as their snapshot, for balances written outside the ledger."""
+    last_entry = select(func.coalesce(func.max(LedgerEntry.id), 0)).scalar_subquery()
+    _upsert_snapshots(select(User.id, func.coalesce(User.coins, 0), last_entry, db.literal(datetime.utcnow()))
+                      .where(db.true()))
+    db.session.commit()
+
+
+def reconcile_balances(limit=None):
+    """Users whose coins differ from their ledger balance, as (id, username, coins, ledger) rows."""
+    tail = _ledger_tail().subquery()
+    expected = func.coalesce(BalanceSnapshot.coins, 0) + func.coalesce(tail.c.amount, 0)
+    query = select(User.id, User.username, User.coins, expected.label('ledger')) \
+        .outerjoin(BalanceSnapshot, BalanceSnapshot.user_id == User.id) \
+        .outerjoin(tail, tail.c.user_id == User.id) \
+        .where(func.coalesce(User.coins, 0) != expected) \
+        .order_by(User.id)
+    return db.session.execute(query.limit(limit)).all()
+
+
+# ============== IDEMPOTENCY ==============
+
+# /bet takes an Idempotency-Key header so double-clicks and retries on slow
+# responses place one bet. The key is stored with the bet in the same
+# transaction under a (user, key) unique constraint. A replay of a committed
+# key is answered from the stored row before anything runs; one that races
+# the first request on another worker fails the insert, rolls back its debit
+# and returns the stored response. Within a worker, duplicates that arrive
+# while the first request is still running wait for its result instead of
+# racing it to the database, and recent results are answered from memory.
+# Rejected bets write nothing and are not stored; a retry simply checks again.
+IDEMPOTENCY_KEY_MAX = 64
+
+
+class IdempotencyConflict(Exception):
+    """Raised when a key is replayed with a different request than it was first used for."""
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None  # (fingerprint, body) once finished, if worth replaying
+        self.expires_at = None
+
+
+class KeyedRequests:
+    """Per-process coalescing and short-lived results of requests keyed by idempotency key."""
+
+    def __init__(self, ttl, max_entries=10000):
+        self._lock = threading.Lock()
+        self._flights = OrderedDict()  # key -> _Flight
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._pruned_at = time.monotonic()
+
+    def begin(self, key):
+        """(flight, True) when the caller should run the request, (flight, False) to wait on it."""
+        with self._lock:
+            now = time.monotonic()
+            while self._flights:
+                oldest = next(iter(self._flights.values()))
+                if oldest.expires_at is None or oldest.expires_at > now:
+                    break
+                self._flights.popitem(last=False)
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            while len(self._flights) > self.max_entries:
+                self._flights.popitem(last=False)
+            return flight, True
+
+    def finish(self, key, flight, result):
+        """Publish the result to waiters; None (a rejection or error) is not kept."""
+        with self._lock:
+            flight.result = result
+            flight.expires_at = time.monotonic() + self.ttl
+            if result is None and self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.done.set()
+
+    def prune_due(self, interval):
+        """True at most once per `interval` seconds, for expiring the stored keys."""
+        with self._lock:
+            if time.monotonic() - self._pruned_at < interval:
+                return False
+            self._pruned_at = time.monotonic()
+            return True
+
+
+bet_requests = KeyedRequests(app.config['IDEMPOTENCY_MEMORY_TTL'])
+
+
+def bet_fingerprint(candidate_id, amount):
+    return f'{candidate_id}:{amount}'
+
+
+def stored_response(user_id, key, fingerprint):
+    """The body stored for a key, or None; raises IdempotencyConflict on a different request."""
+    stored = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+    if stored is None:
+        return None
+    if stored.fingerprint != fingerprint:
+        raise IdempotencyConflict('This idempotency key was already used for a different bet')
+    return json.loads(stored.response)
+
+
+def prune_idempotency_keys():
+    """Forget stored keys older than IDEMPOTENCY_TTL; a replay after that places a new bet."""
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['IDEMPOTENCY_TTL'])
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff))
+    db.session.commit()
+
+
+# ============== SETTLEMENT JOBS ==============
+
+# One worker keeps jobs in submission order (a layoff and its undo must not race)
+settlement_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='settlement')
+
+
+def _settlement_still_applies(job):
+    """Skip jobs whose trigger was undone before they ran."""
+    if job.kind in ('candidate_layoff', 'candidate_reset'):
+        candidate = db.session.get(Candidate, job.target_id)
+        return candidate is not None and candidate.is_laid_off == (job.kind == 'candidate_layoff')
+    position = db.session.get(Position, job.target_id)
+    return position is not None and position_cuts_exhausted(position) == (job.kind == 'position_close')
+
+
+def _settlement_department_ids(job):
+    if job.kind in ('candidate_layoff', 'candidate_reset'):
+        query = db.session.query(Position.department_id).join(Candidate).filter(Candidate.id == job.target_id)
+    else:
+        query = db.session.query(Position.department_id).filter(Position.id == job.target_id)
+    return [dept_id for dept_id, in query]
+
+
+def _claimable_jobs():
+    """Queued jobs, and running ones whose worker stopped sending heartbeats."""
+    expired = datetime.utcnow() - timedelta(seconds=app.config['SETTLEMENT_LEASE'])
+    return db.or_(
+        SettlementJob.status == 'queued',
+        db.and_(SettlementJob.status == 'running',
+                db.or_(SettlementJob.heartbeat_at.is_(None), SettlementJob.heartbeat_at < expired)),
+    )
+
+
+def claim_settlement_job(job_id):
+    """Atomically take a job for this worker; False when someone else holds it."""
+    claimed = db.session.execute(
+        update(SettlementJob)
+        .where(SettlementJob.id == job_id, _claimable_jobs())
+        .values(status='running', heartbeat_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def run_settlement_job(job_id):
+    """Process a settlement job in batches, committing progress after each."""
+    if not claim_settlement_job(job_id):
+        return
+    job = db.session.get(SettlementJob, job_id)
+    db.session.refresh(job)
+    try:
+        if not _settlement_still_applies(job):
+            job.total = 0
+        else:
+            job.total = job.processed + sum(
+                _bet_totals(*criteria)['bets'] for criteria in settlement_criteria(job.kind, job.target_id))
+        db.session.commit()
+
+        while job.total:
+            batch = apply_settlement(job.kind, job.target_id, limit=app.config['SETTLEMENT_BATCH_SIZE'])
+            if not batch['bets']:
+                break
+            job.processed += batch['bets']
+            job.coins += batch['coins']
+            job.shortfall = (job.shortfall or 0) + batch['shortfall']
+            job.heartbeat_at = datetime.utcnow()
+            db.session.commit()
+            leaderboard_cache.update(batch['balances'])
+            publish_balances(batch['balances'])
+
+        job.total = job.processed
+        job.status = 'done'
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(SettlementJob, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+        print(f"Settlement job {job_id} failed: {e}")
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    invalidate_department_pages(*_settlement_department_ids(job))
+
+
+def _run_settlement_job_in_context(job_id):
+    with app.app_context():
+        run_settlement_job(job_id)
+
+
+def enqueue_settlement(kind, target_id):
+    """Persist a settlement job and hand it to the worker (or run it inline)."""
+    job = SettlementJob(kind=kind, target_id=target_id)
+    db.session.add(job)
+    db.session.commit()
+    if app.config['SETTLEMENT_ASYNC']:
+        settlement_executor.submit(_run_settlement_job_in_context, job.id)
+    else:
+        run_settlement_job(job.id)
+    return job
+
+
+def enqueue_position_settlement(position):
+    """Close a position's open bets once its cuts are used up, or reopen them."""
+    if position_cuts_exhausted(position):
+        return enqueue_settlement('position_close', position.id)
+    criteria, = settlement_criteria('position_reopen', position.id)
+    if db.session.query(Bet.id).filter(*criteria).first():
+        return enqueue_settlement('position_reopen', position.id)
+    return None
+
+
+def apply_cut_changes(*positions):
+    """Follow up committed positions_to_cut changes: settle, re-price and refresh pages."""
+    for position in positions:
+        enqueue_position_settlement(position)
+    odds_engine.mark(*(position.id for position in positions))
+    invalidate_department_pages(*{position.department_id for position in positions})
+
+
+def resume_settlement_jobs():
+    """Pick up queued jobs and ones whose worker died (its lease expired).
+
+    Jobs are left as they are; each run claims its job atomically, so a job
+    another live worker is already processing is not started twice.
+    """
+    pending = [job_id for job_id, in db.session.query(SettlementJob.id)
+               .filter(_claimable_jobs()).order_by(SettlementJob.id)]
+    for job_id in pending:
+        if app.config['SETTLEMENT_ASYNC']:
+            settlement_executor.submit(_run_settlement_job_in_context, job_id)
+        else:
+            run_settlement_job(job_id)
+    if pending:
+        print(f"Resumed {len(pending)} settlement job(s)")
+    return len(pending)
+
+
+# ============== ODDS ENGINE ==============
+
+# The admin's opening odds (base_odds) stay the price; money only moves them
+# relative to each other. Each open candidate's weight is their staked coins
+# plus a prior of ODDS_PRIOR_STAKE / opening odds, and their odds are the
+# opening odds scaled by how their share of the weight compares with their
+# share before any bets. The listed candidates are rarely a position's whole
+# headcount, so the engine never prices absolute layoff chances: a position
+# with no bets, or a single listed candidate, keeps the admin's odds. Bets only
+# mark their position dirty: dirty positions are recomputed together at most
+# once per ODDS_INTERVAL and written back in a single UPDATE, so a burst of
+# bets costs one write per interval. Bets lock in whatever odds are current
+# (odds_at_bet), exactly as with hand-set odds.
+ODDS_MIN = 1.05
+ODDS_MAX = 50.0
+
+
+def compute_position_odds(candidates, remaining_cuts, prior_stake):
+    """{candidate id: odds} for a position's open candidates, or {} to leave them alone.
+
+    `candidates` is a list of (id, opening odds, staked coins).
+    """
+    if remaining_cuts <= 0 or not any(staked for _, _, staked in candidates):
+        return {}
+    priors = {cid: prior_stake / max(base, ODDS_MIN) for cid, base, _ in candidates}
+    weights = {cid: priors[cid] + staked for cid, _, staked in candidates}
+    prior_total, total = sum(priors.values()), sum(weights.values())
+    odds = {}
+    for cid, base, _ in candidates:
+        shift = (priors[cid] / prior_total) / (weights[cid] / total)
+        odds[cid] = round(min(max(base * shift, ODDS_MIN), ODDS_MAX), 2)
+    return odds
+
+
+def recompute_odds(position_ids):
+    """Recompute and store odds for the positions; returns {candidate id: (department id, odds)} changed."""
+    if not position_ids:
+        return {}
+    rows = db.session.execute(
+        select(Candidate.id, Candidate.position_id, Candidate.odds, Candidate.base_odds, Candidate.is_laid_off,
+               func.coalesce(CandidatePool.total_staked, 0).label('staked'),
+               Position.positions_to_cut, Position.department_id)
+        .join(Position, Candidate.position_id == Position.id)
+        .outerjoin(CandidatePool, CandidatePool.candidate_id == Candidate.id)
+        .where(Candidate.position_id.in_(position_ids))
+    ).all()
+
+    by_position = {}
+    for row in rows:
+        by_position.setdefault(row.position_id, []).append(row)
+    changed = {}
+    for position_rows in by_position.values():
+        open_rows = [r for r in position_rows if not r.is_laid_off]
+        remaining = (position_rows[0].positions_to_cut or 0) - (len(position_rows) - len(open_rows))
+        odds = compute_position_odds([(r.id, r.base_odds or r.odds, r.staked) for r in open_rows], remaining,
+                                     app.config['ODDS_PRIOR_STAKE'])
+        for r in open_rows:
+            if r.id in odds and abs(odds[r.id] - (r.odds or 0)) >= 0.01:
+                changed[r.id] = (r.department_id, odds[r.id])
+
+    if changed:
+        db.session.execute(
+            update(Candidate)
+            .where(Candidate.id.in_(changed))
+            .values(odds=db.case({cid: new for cid, (_, new) in changed.items()}, value=Candidate.id))
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return changed
+
+
+class OddsEngine:
+    """Collects positions touched by bets and recomputes them at a bounded rate."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._last_run = 0.0
+        self._scheduled = False
+
+    def mark(self, *position_ids):
+        """Note that the positions' stakes changed; recompute now or schedule it."""
+        if not app.config['ODDS_ENGINE_ENABLED']:
+            return
+        with self._lock:
+            self._dirty.update(pid for pid in position_ids if pid)
+            wait = self._last_run + app.config['ODDS_INTERVAL'] - time.monotonic()
+            if self._scheduled or not self._dirty:
+                return
+            if app.config['ODDS_ASYNC']:
+                self._scheduled = True
+                timer = threading.Timer(max(wait, 0), self._run_in_context)
+                timer.daemon = True
+                timer.start()
+                return
+            if wait > 0:
+                return  # Serverless: the next bet after the interval picks these up
+        self.run()
+
+    def _run_in_context(self):
+        with app.app_context():
+            self.run()
+
+    def run(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            self._last_run = time.monotonic()
+            self._scheduled = False
+        try:
+            changed = recompute_odds(dirty)
+        except Exception as e:
+            db.session.rollback()
+            with self._lock:
+                self._dirty |= dirty  # Retry with the next bet
+            print(f"Odds recompute failed: {e}")
+            return
+        for cid, (_, odds) in changed.items():
+            event_broker.publish('public', 'odds', {'candidate_id': cid, 'odds': odds})
+        invalidate_department_pages(*{dept_id for dept_id, _ in changed.values()})
+
+
+odds_engine = OddsEngine()
+
+
+# ============== WHAT-IF SIMULATION ==============
+
+# What a layoff decision would cost the coin economy before an admin makes it.
+# All open bets on the scope's open candidates are loaded into NumPy arrays;
+# every candidate's payout is one bincount. Outcomes are sampled by drawing
+# each position's remaining cuts without replacement from its open candidates
+# (Gumbel top-k over the odds-implied probabilities, all samples at once), so
+# total payout per sample is a single matrix-vector product.
+# Per-user distributions are only kept for the users most exposed on average.
+WHATIF_SAMPLES = 2000
+WHATIF_MAX_SAMPLES = 20000
+WHATIF_TOP_USERS = 20
+WHATIF_WEIGHTINGS = ('odds', 'uniform')
+
+
+def _distribution(np, values):
+    if not len(values):
+        return None
+    p5, p50, p95, p99 = np.percentile(values, [5, 50, 95, 99])
+    return {'mean': round(float(values.mean()), 1), 'std': round(float(values.std()), 1),
+            'min': int(values.min()), 'p5': int(p5), 'p50': int(p50), 'p95': int(p95), 'p99': int(p99),
+            'max': int(values.max())}
+
+
+def sample_layoffs(np, rng, columns, remaining, weights, samples, outcomes):
+    """Mark `remaining` of `columns` laid off in each row of `outcomes`, drawn by `weights`."""
+    n = len(columns)
+    if remaining <= 0 or not n:
+        return
+    if remaining >= n:
+        outcomes[:, columns] = True
+        return
+    keys = np.log(weights) + rng.gumbel(size=(samples, n))
+    picked = np.argpartition(-keys, remaining - 1, axis=1)[:, :remaining]
+    outcomes[np.arange(samples)[:, None], columns[picked]] = True
+
+
+def _driver_cursor(statement):
+    """Run a Core select on the raw DB-API cursor, skipping SQLAlchemy's per-row result handling."""
+    connection = db.session.connection()
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    cursor = connection.connection.cursor()
+    cursor.execute(compiled.string, params)
+    return cursor
+
+
+def simulate_layoffs(position_ids, samples=WHATIF_SAMPLES, weighting='odds', seed=None):
+    """Payout per candidate and the sampled payout distribution for the positions' open bets."""
+    import numpy as np  # Only this admin report needs NumPy
+    started = time.perf_counter()
+
+    laid_off = func.sum(db.case((Candidate.is_laid_off.is_(True), 1), else_=0))
+    positions = db.session.execute(
+        select(Position.id, Position.title, Position.positions_to_cut, func.coalesce(laid_off, 0).label('laid_off'))
+        .outerjoin(Candidate, Candidate.position_id == Position.id)
+        .where(Position.id.in_(position_ids))
+        .group_by(Position.id, Position.title, Position.positions_to_cut)
+        .order_by(Position.id)
+    ).all()
+    candidates = db.session.execute(
+        select(Candidate.id, Candidate.name, Candidate.position_id, Candidate.odds)
+        .where(Candidate.position_id.in_(position_ids), Candidate.is_laid_off.isnot(True))
+        .order_by(Candidate.id)
+    ).all()
+    # Loading the bets is most of the report: read them off the covering index
+    # through the driver cursor straight into one array
+    open_bets = _driver_cursor(
+        select(Bet.user_id, Bet.candidate_id, Bet.amount, payout_expr())
+        .where(Bet.candidate_id.in_([c.id for c in candidates]), Bet.is_resolved.isnot(True))
+    )
+    try:
+        bets = np.fromiter(itertools.chain.from_iterable(open_bets), dtype=np.int64).reshape(-1, 4)
+    finally:
+        open_bets.close()
+
+    candidate_ids = np.array([c.id for c in candidates], dtype=np.int64)
+    candidate_positions = np.array([c.position_id for c in candidates], dtype=np.int64)
+    user_ids, bet_user = np.unique(bets[:, 0], return_inverse=True)
+    bet_candidate = np.searchsorted(candidate_ids, bets[:, 1])
+    bet_stake, bet_payout = bets[:, 2], bets[:, 3]
+    n_candidates, n_users = len(candidate_ids), len(user_ids)
+
+    bet_count = np.bincount(bet_candidate, minlength=n_candidates)
+    stake = np.bincount(bet_candidate, weights=bet_stake, minlength=n_candidates)
+    payout = np.bincount(bet_candidate, weights=bet_payout, minlength=n_candidates)
+    user_stake = np.bincount(bet_user, weights=bet_stake, minlength=n_users)
+
+    rng = np.random.default_rng(seed)
+    if weighting == 'odds':
+        weights = 1 / np.maximum(np.array([c.odds or ODDS_MAX for c in candidates], dtype=float), ODDS_MIN)
+    else:
+        weights = np.ones(n_candidates)
+    outcomes = np.zeros((samples, n_candidates), dtype=bool)
+    for position in positions:
+        columns = np.flatnonzero(candidate_positions == position.id)
+        remaining = (position.positions_to_cut or 0) - position.laid_off
+        sample_layoffs(np, rng, columns, remaining, weights[columns], samples, outcomes)
+
+    total_payout = outcomes @ payout
+    layoff_probability = outcomes.mean(axis=0) if samples else np.zeros(n_candidates)
+    expected_user = np.bincount(bet_user, weights=layoff_probability[bet_candidate] * bet_payout,
+                                minlength=n_users)
+
+    # Full per-sample distributions for the most exposed users only
+    top = np.argsort(-expected_user, kind='stable')[:WHATIF_TOP_USERS]
+    rank = np.full(n_users, -1)
+    rank[top] = np.arange(len(top))
+    keep = rank[bet_user] >= 0
+    exposure = np.zeros((n_candidates, len(top)))
+    np.add.at(exposure, (bet_candidate[keep], rank[bet_user[keep]]), bet_payout[keep])
+    user_payouts = outcomes @ exposure
+    usernames = dict(db.session.execute(
+        select(User.id, User.username).where(User.id.in_(user_ids[top].tolist()))
+    ).all()) if len(top) else {}
+
+    open_stake = int(stake.sum())
+    return {
+        'positions': [{'id': p.id, 'title': p.title, 'remaining_cuts': max((p.positions_to_cut or 0) - p.laid_off, 0)}
+                      for p in positions],
+        'open_bets': len(bets),
+        'open_stake': open_stake,
+        'users': n_users,
+        'candidates': [{
+            'id': c.id,
+            'name': c.name,
+            'position_id': c.position_id,
+            'odds': c.odds,
+            'bets': int(bet_count[i]),
+            'staked': int(stake[i]),
+            'payout_if_laid_off': int(payout[i]),
+            'layoff_probability': round(float(layoff_probability[i]), 4),
+        } for i, c in enumerate(candidates)],
+        'simulation': {
+            'samples': samples,
+            'weighting': weighting,
+            'total_payout': _distribution(np, total_payout),
+            'coins_created': _distribution(np, total_payout - open_stake),
+        },
+        'top_users': [{
+            'user_id': int(user_ids[u]),
+            'username': usernames.get(int(user_ids[u])),
+            'staked': int(user_stake[u]),
+            'expected_payout': round(float(expected_user[u]), 1),
+            'payout': _distribution(np, user_payouts[:, column]),
+            'chance_of_profit': round(float((user_payouts[:, column] > user_stake[u]).mean()), 4) if samples else None,
+        } for column, u in enumerate(top)],
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+# ============== QUERY INSTRUMENTATION ==============
+
+# View name -> most queries one request may issue, declared with @query_budget
+QUERY_BUDGETS = {}
+
+
+def query_budget(max_queries):
+    """Declare a view's query budget; requests over it are logged and flagged in /admin/queries."""
+    def decorator(view):
+        QUERY_BUDGETS[view.__name__] = max_queries
+        return view
+    return decorator
+
+
+class RequestQueryStats:
+    """Queries and template time for the current request (stored on flask.g)."""
+
+    SLOWEST = 3
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.statements = []  # (seconds, sql)
+
+    def add(self, seconds, statement):
+        self.count += 1
+        self.db_seconds += seconds
+        self.statements.append((seconds, statement))
+
+    def slowest(self):
+        return sorted(self.statements, key=lambda s: s[0], reverse=True)[:self.SLOWEST]
+
+
+class QueryReport:
+    """Rolling window of instrumented requests, summarized per endpoint."""
+
+    def __init__(self, history):
+        self._lock = threading.Lock()
+        self._requests = deque(maxlen=history)
+
+    def record(self, endpoint, stats, total_seconds):
+        budget = QUERY_BUDGETS.get(endpoint)
+        with self._lock:
+            self._requests.append({
+                'endpoint': endpoint,
+                'queries': stats.count,
+                'db_ms': stats.db_seconds * 1000,
+                'template_ms': stats.template_seconds * 1000,
+                'total_ms': total_seconds * 1000,
+                'over_budget': budget is not None and stats.count > budget,
+                'slowest': [(seconds * 1000, sql) for seconds, sql in stats.slowest()],
+            })
+
+    def snapshot(self):
+        with self._lock:
+            requests = list(self._requests)
+        endpoints = {}
+        for r in requests:
+            e = endpoints.setdefault(r['endpoint'], {
+                'requests': 0, 'budget': QUERY_BUDGETS.get(r['endpoint']), 'over_budget': 0,
+                'queries_max': 0, 'queries_total': 0, 'db_ms_total': 0.0, 'db_ms_max': 0.0,
+                'template_ms_total': 0.0, 'total_ms_total': 0.0,
+            })
+            e['requests'] += 1
+            e['over_budget'] += r['over_budget']
+            e['queries_max'] = max(e['queries_max'], r['queries'])
+            e['queries_total'] += r['queries']
+            e['db_ms_total'] += r['db_ms']
+            e['db_ms_max'] = max(e['db_ms_max'], r['db_ms'])
+            e['template_ms_total'] += r['template_ms']
+            e['total_ms_total'] += r['total_ms']
+        for e in endpoints.values():
+            n = e['requests']
+            e.update(queries_avg=round(e.pop('queries_total') / n, 1),
+                     db_ms_avg=round(e.pop('db_ms_total') / n, 2),
+                     db_ms_max=round(e['db_ms_max'], 2),
+                     template_ms_avg=round(e.pop('template_ms_total') / n, 2),
+                     total_ms_avg=round(e.pop('total_ms_total') / n, 2))
+        slowest = sorted(((ms, r['endpoint'], sql) for r in requests for ms, sql in r['slowest']),
+                         key=lambda s: s[0], reverse=True)[:10]
+        return {
+            'requests': len(requests),
+            'endpoints': endpoints,
+            'slowest_statements': [{'ms': round(ms, 2), 'endpoint': endpoint, 'sql': sql}
+                                   for ms, endpoint, sql in slowest],
+        }
+
+
+query_report = QueryReport(app.config['QUERY_STATS_HISTORY'])
+
+
+def _current_query_stats():
+    return g.get('query_stats') if has_request_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    if _current_query_stats() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_query_stats()
+    if stats is not None and conn.info.get('query_started'):
+        stats.add(time.perf_counter() - conn.info['query_started'].pop(), statement)
+
+
+@before_render_template.connect_via(app)
+def _template_started(sender, template, context, **extra):
+    stats = _current_query_stats()
+    if stats is not None:
+        g.template_started = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def _template_finished(sender, template, context, **extra):
+    stats = _current_query_stats()
+    if stats is not None and g.get('template_started'):
+        # Includes lazy loads triggered from the template, which also count as DB time
+        stats.template_seconds += time.perf_counter() - g.pop('template_started')
+
+
+@app.before_request
+def start_query_stats():
+    if app.config['QUERY_STATS_ENABLED']:
+        g.query_stats = RequestQueryStats()
+
+
+@app.after_request
+def finish_query_stats(response):
+    stats = g.pop('query_stats', None)
+    if stats is None:
+        return response
+    total = time.perf_counter() - stats.started
+    response.headers.add('Server-Timing', f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.count} queries"')
+    response.headers.add('Server-Timing', f'render;dur={stats.template_seconds * 1000:.1f}')
+    response.headers.add('Server-Timing', f'app;dur={total * 1000:.1f}')
+    response.headers['X-Query-Count'] = str(stats.count)
+
+    budget = QUERY_BUDGETS.get(request.endpoint)
+    if budget is not None and stats.count > budget:
+        app.logger.warning('%s issued %d queries (budget %d)', request.endpoint, stats.count, budget)
+    query_report.record(request.endpoint, stats, total)
+    return response
+
+
 # ============== ADMIN ROUTES ==============
 
 @app.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     if request.method == 'POST':
+        ensure_default_admin()
         username = request.form.get('username')
         password = request.form.get('password')
         admin = Admin.query.filter_by(username=username).first()
@@ -143,15 +2240,14 @@ def admin_logout():
 @app.route('/admin')
 @login_required
 def admin_dashboard():
-    departments = Department.query.all()
-    total_employees = sum(p.total_employees for d in departments for p in d.positions)
-    total_to_cut = sum(p.positions_to_cut for d in departments for p in d.positions)
+    tree = load_department_tree(with_candidate_counts=True)
     total_candidates = Candidate.query.count()
     total_bets = Bet.query.count()
     return render_template('admin/dashboard.html', 
-                         departments=departments,
-                         total_employees=total_employees,
-                         total_to_cut=total_to_cut,
+                         departments=tree['departments'],
+                         candidate_counts=tree['candidate_counts'],
+                         total_employees=tree['total_employees'],
+                         total_to_cut=tree['total_to_cut'],
                          total_candidates=total_candidates,
                          total_bets=total_bets)
 
@@ -165,6 +2261,7 @@ def admin_departments():
         dept = Department(name=name, code=code)
         db.session.add(dept)
         db.session.commit()
+        invalidate_department_pages(dept.id)
         flash('Department added!', 'success')
         return redirect(url_for('admin_departments'))
     departments = Department.query.all()
@@ -175,8 +2272,11 @@ def admin_departments():
 @login_required
 def delete_department(id):
     dept = Department.query.get_or_404(id)
-    db.session.delete(dept)
+    bettors = bettor_ids(Position.department_id == id)
+    db.session.delete(dept)  # Cascades to positions, candidates and their bets
     db.session.commit()
+    recompute_user_stats(bettors)
+    invalidate_department_pages(id)
     flash('Department deleted!', 'success')
     return redirect(url_for('admin_departments'))
 
@@ -195,6 +2295,7 @@ def admin_positions():
                       positions_to_cut=positions_to_cut, department_id=department_id)
         db.session.add(pos)
         db.session.commit()
+        invalidate_department_pages(pos.department_id)
         flash('Position added!', 'success')
         return redirect(url_for('admin_positions'))
     positions = Position.query.all()
@@ -208,6 +2309,7 @@ def update_position_cuts(id):
     pos = Position.query.get_or_404(id)
     pos.positions_to_cut = int(request.form.get('positions_to_cut', 0))
     db.session.commit()
+    apply_cut_changes(pos)
     flash(f'Updated: {pos.title} - {pos.positions_to_cut} to cut', 'success')
     return redirect(url_for('admin_positions'))
 
@@ -216,8 +2318,12 @@ def update_position_cuts(id):
 @login_required
 def delete_position(id):
     pos = Position.query.get_or_404(id)
+    department_id = pos.department_id
+    bettors = bettor_ids(Candidate.position_id == id)
     db.session.delete(pos)
     db.session.commit()
+    recompute_user_stats(bettors)
+    invalidate_department_pages(department_id)
     flash('Position deleted!', 'success')
     return redirect(url_for('admin_positions'))
 
@@ -226,34 +2332,44 @@ def delete_position(id):
 @login_required
 def admin_candidates():
     if request.method == 'POST':
+        try:
+            file = request.files.get('photo')  # Parses the form, checking the photo as it streams in
+        except RequestEntityTooLarge as e:  # The whole request, not just the photo
+            flash(f'Photo rejected: {e.description}', 'error')
+            return redirect(url_for('admin_candidates'))
         name = request.form.get('name')
         bio = request.form.get('bio')
         odds = float(request.form.get('odds', 2.0))
         position_id = int(request.form.get('position_id'))
         
         photo_filename = 'default.png'
+        queue_thumbnails = None
         # File upload only works locally, not on Vercel (read-only filesystem)
-        if not IS_VERCEL and 'photo' in request.files:
-            file = request.files['photo']
-            if file and file.filename and allowed_file(file.filename):
-                try:
-                    filename = secure_filename(file.filename)
-                    filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                    file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                    photo_filename = filename
-                except Exception as e:
-                    print(f"Photo upload failed: {e}")
+        if not IS_VERCEL and file and file.filename:
+            try:
+                photo_filename, queue_thumbnails = accept_photo_upload(file)
+            except PhotoRejected as e:
+                flash(f'Photo rejected ({e}); using the default photo.', 'error')
+            except Exception as e:
+                print(f"Photo upload failed: {e}")
         
-        candidate = Candidate(name=name, bio=bio, odds=odds, 
+        candidate = Candidate(name=name, bio=bio, odds=odds, base_odds=odds,
                             position_id=position_id, photo=photo_filename)
         db.session.add(candidate)
         db.session.commit()
+        if queue_thumbnails:
+            queue_thumbnails()
+        # Odds stay as entered; the engine rebalances the position with its next bet
+        invalidate_department_pages(candidate.position.department_id)
         flash('Candidate added to the death pool! 💀', 'success')
         return redirect(url_for('admin_candidates'))
     
     candidates = Candidate.query.all()
     positions = Position.query.all()
-    return render_template('admin/candidates.html', candidates=candidates, positions=positions)
+    pools = {pool.candidate_id: pool for pool in CandidatePool.query.all()}
+    position_pools = {pool.position_id: pool for pool in PositionPool.query.all()}
+    return render_template('admin/candidates.html', candidates=candidates, positions=positions,
+                           pools=pools, position_pools=position_pools)
 
 
 @app.route('/admin/candidates/<int:id>/edit', methods=['GET', 'POST'])
@@ -261,24 +2377,41 @@ def admin_candidates():
 def edit_candidate(id):
     candidate = Candidate.query.get_or_404(id)
     if request.method == 'POST':
+        try:
+            file = request.files.get('photo')  # Parses the form, checking the photo as it streams in
+        except RequestEntityTooLarge as e:  # The whole request, not just the photo
+            flash(f'Photo rejected: {e.description}', 'error')
+            return redirect(url_for('edit_candidate', id=id))
         candidate.name = request.form.get('name')
         candidate.bio = request.form.get('bio')
-        candidate.odds = float(request.form.get('odds', 2.0))
+        old_odds = candidate.odds
+        old_base_odds = candidate.base_odds
+        candidate.base_odds = float(request.form.get('odds', 2.0))
+        if candidate.base_odds != old_base_odds:
+            candidate.odds = candidate.base_odds  # The engine re-balances from here
+        old_position_id = candidate.position_id
+        old_department_id = candidate.position.department_id
         candidate.position_id = int(request.form.get('position_id'))
         
         # File upload only works locally, not on Vercel
-        if not IS_VERCEL and 'photo' in request.files:
-            file = request.files['photo']
-            if file and file.filename and allowed_file(file.filename):
-                try:
-                    filename = secure_filename(file.filename)
-                    filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                    file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                    candidate.photo = filename
-                except Exception:
-                    pass
+        queue_thumbnails = None
+        if not IS_VERCEL and file and file.filename:
+            try:
+                candidate.photo, queue_thumbnails = accept_photo_upload(file)
+            except PhotoRejected as e:
+                flash(f'Photo rejected ({e}); keeping the current photo.', 'error')
+            except Exception:
+                pass
         
         db.session.commit()
+        if queue_thumbnails:
+            queue_thumbnails()
+        if candidate.position_id != old_position_id:
+            recompute_betting_pools()  # Their bets now count toward another position
+        if candidate.odds != old_odds:
+            event_broker.publish('public', 'odds', {'candidate_id': candidate.id, 'odds': candidate.odds})
+        odds_engine.mark(old_position_id, candidate.position_id)
+        invalidate_department_pages(old_department_id, db.session.get(Position, candidate.position_id).department_id)
         flash('Candidate updated!', 'success')
         return redirect(url_for('admin_candidates'))
     
@@ -290,8 +2423,15 @@ def edit_candidate(id):
 @login_required
 def delete_candidate(id):
     candidate = Candidate.query.get_or_404(id)
+    department_id = candidate.position.department_id
+    position_id = candidate.position_id
+    bettors = bettor_ids(Bet.candidate_id == id)
     db.session.delete(candidate)
     db.session.commit()
+    recompute_user_stats(bettors)
+    recompute_betting_pools()
+    odds_engine.mark(position_id)
+    invalidate_department_pages(department_id)
     flash('Candidate removed from the pool!', 'success')
     return redirect(url_for('admin_candidates'))
 
@@ -301,39 +2441,161 @@ def delete_candidate(id):
 def mark_laid_off(id):
     candidate = Candidate.query.get_or_404(id)
     candidate.is_laid_off = not candidate.is_laid_off
+    db.session.commit()
+    event_broker.publish('public', 'layoff', {'candidate_id': candidate.id, 'is_laid_off': candidate.is_laid_off})
+    invalidate_department_pages(candidate.position.department_id)
+    
+    # Resolve (or reverse) bets in the background so the request stays fast
+    job = enqueue_settlement('candidate_layoff' if candidate.is_laid_off else 'candidate_reset', candidate.id)
+    enqueue_position_settlement(candidate.position)
+    odds_engine.mark(candidate.position_id)  # One fewer cut left for the rest
     
-    # Resolve bets for this candidate
     if candidate.is_laid_off:
-        for bet in candidate.bets:
-            if not bet.is_resolved:
-                bet.is_resolved = True
-                bet.won = True
-                # Pay out winnings
-                winnings = int(bet.amount * bet.odds_at_bet)
-                bet.user.coins += winnings
-        flash(f'💀 {candidate.name} has been LAID OFF! Bets resolved.', 'danger')
+        flash(f'💀 {candidate.name} has been LAID OFF! Settlement job #{job.id} {job.status}.', 'danger')
     else:
-        flash(f'{candidate.name} status reset.', 'info')
-    
-    db.session.commit()
+        flash(f'{candidate.name} status reset. Reversal job #{job.id} {job.status}.', 'info')
     return redirect(url_for('admin_candidates'))
 
 
+@app.route('/admin/startup')
+@login_required
+def admin_startup():
+    return jsonify({
+        'report': startup_report(),
+        'timings_ms': {phase: round(seconds * 1000, 1) for phase, seconds in STARTUP_TIMINGS.items()}
+    })
+
+
+@app.route('/admin/pool')
+@login_required
+def admin_pool():
+    metrics = pool_metrics.snapshot(db.engine.pool)
+    metrics['profile'] = app.config['DB_ENGINE_PROFILE']
+    return jsonify(metrics)
+
+
+@app.route('/admin/queries')
+@login_required
+def admin_queries():
+    report = query_report.snapshot()
+    report['enabled'] = app.config['QUERY_STATS_ENABLED']
+    return jsonify(report)
+
+
+@app.route('/admin/whatif')
+@login_required
+def admin_whatif():
+    position_id = request.args.get('position_id', type=int)
+    department_id = request.args.get('department_id', type=int)
+    if position_id:
+        position_ids = [Position.query.get_or_404(position_id).id]
+    elif department_id:
+        position_ids = [p.id for p in Department.query.get_or_404(department_id).positions]
+    else:
+        return jsonify({'error': 'position_id or department_id is required'}), 400
+    weighting = request.args.get('weighting', 'odds')
+    if weighting not in WHATIF_WEIGHTINGS:
+        return jsonify({'error': f"weighting must be one of {', '.join(WHATIF_WEIGHTINGS)}"}), 400
+    samples = min(max(request.args.get('samples', WHATIF_SAMPLES, type=int), 0), WHATIF_MAX_SAMPLES)
+    try:
+        report = simulate_layoffs(position_ids, samples, weighting, seed=request.args.get('seed', type=int))
+    except ImportError:
+        return jsonify({'error': 'NumPy is not installed'}), 501
+    return jsonify(report)
+
+
+@app.route('/admin/ledger')
+@login_required
+def admin_ledger():
+    mismatches = reconcile_balances(limit=100)
+    snapshots, oldest = db.session.query(func.count(BalanceSnapshot.user_id), func.min(BalanceSnapshot.taken_at)).one()
+    return jsonify({
+        'entries': db.session.query(func.count(LedgerEntry.id)).scalar(),
+        'snapshots': snapshots,
+        'oldest_snapshot': oldest.isoformat() if oldest else None,
+        'mismatches': [{'user_id': r.id, 'username': r.username, 'coins': r.coins, 'ledger': r.ledger}
+                       for r in mismatches],
+    })
+
+
+@app.route('/admin/users/<int:id>/adjust', methods=['POST'])
+@login_required
+def adjust_user_coins(id):
+    data = request.get_json(silent=True) or {}
+    try:
+        amount = int(data.get('amount', 0))
+    except (TypeError, ValueError):
+        amount = 0
+    if not amount or not data.get('note'):
+        return jsonify({'success': False, 'message': 'A non-zero amount and a note are required'}), 400
+    coins = adjust_coins(id, amount, f"{current_user.username}: {data['note']}"[:200])
+    if coins is None:
+        db.session.rollback()
+        abort(404)
+    db.session.commit()
+    leaderboard_cache.update([(id, coins)])
+    publish_balances([(id, coins)])
+    return jsonify({'success': True, 'user_id': id, 'coins': coins})
+
+
+@app.route('/admin/jobs')
+@login_required
+def admin_jobs():
+    jobs = SettlementJob.query.order_by(SettlementJob.id.desc()).limit(50).all()
+    return render_template('admin/jobs.html', jobs=jobs)
+
+
+@app.route('/admin/jobs/resume', methods=['POST'])
+@login_required
+def admin_resume_jobs():
+    resumed = resume_settlement_jobs()
+    flash(f'Resumed {resumed} stalled settlement job(s).' if resumed else 'No stalled settlement jobs.', 'info')
+    return redirect(url_for('admin_jobs'))
+
+
+@app.route('/admin/jobs/<int:id>')
+@login_required
+def admin_job_status(id):
+    job = SettlementJob.query.get_or_404(id)
+    return jsonify({
+        'id': job.id,
+        'kind': job.kind,
+        'target_id': job.target_id,
+        'status': job.status,
+        'total': job.total,
+        'processed': job.processed,
+        'progress': job.progress,
+        'coins': job.coins,
+        'shortfall': job.shortfall or 0,
+        'error': job.error
+    })
+
+
 # ============== USER ROUTES ==============
 
 @app.route('/')
+@query_budget(2)
+@cached_page
 def index():
-    departments = Department.query.all()
-    total_employees = sum(p.total_employees for d in departments for p in d.positions)
-    total_to_cut = sum(p.positions_to_cut for d in departments for p in d.positions)
-    return render_template('index.html', departments=departments, 
-                          total_employees=total_employees, total_to_cut=total_to_cut)
+    tree = load_department_tree()
+    return render_template('index.html', departments=tree['departments'], 
+                          total_employees=tree['total_employees'], total_to_cut=tree['total_to_cut'])
 
 
 @app.route('/department/<int:id>')
+@query_budget(5)
+@cached_page
 def department_view(id):
-    department = Department.query.get_or_404(id)
-    return render_template('department.html', department=department)
+    department = Department.query.options(
+        selectinload(Department.positions).selectinload(Position.candidates)
+    ).get_or_404(id)
+    position_ids = [p.id for p in department.positions]
+    position_pools = {pool.position_id: pool for pool in
+                      PositionPool.query.filter(PositionPool.position_id.in_(position_ids))}
+    pools = {pool.candidate_id: pool for pool in
+             CandidatePool.query.join(Candidate).filter(Candidate.position_id.in_(position_ids))}
+    return render_template('department.html', department=department,
+                           pools=pools, position_pools=position_pools)
 
 
 @app.route('/candidate/<int:id>')
@@ -342,6 +2604,17 @@ def candidate_view(id):
     return render_template('candidate.html', candidate=candidate)
 
 
+@app.route('/photos/<path:filename>')
+def photo(filename):
+    """Content-addressed photos and thumbnails; the name changes whenever the bytes do."""
+    if not (photo_digest(filename) or _THUMBNAIL.match(filename)):
+        abort(404)
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=PHOTO_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
 @app.route('/register', methods=['POST'])
 def register():
     username = request.form.get('username')
@@ -350,69 +2623,382 @@ def register():
     
     user = User(username=username)
     db.session.add(user)
+    db.session.flush()
+    record_ledger(user.id, user.coins, 'grant', note='Starting coins')
     db.session.commit()
+    leaderboard_cache.add(user.id, user.username, user.coins)
     return jsonify({'success': True, 'user_id': user.id, 'coins': user.coins})
 
 
 @app.route('/user/<int:id>')
+@query_budget(3)
 def user_profile(id):
     user = User.query.get_or_404(id)
-    return render_template('profile.html', user=user)
+    bets, next_cursor = load_bet_history(user.id, before=request.args.get('before'))
+    return render_template('profile.html', user=user, rank=leaderboard_cache.rank(user.id),
+                           bets=bets, next_cursor=next_cursor)
+
+
+def _commit_keyed(user_id, key, fingerprint, place):
+    """Run place() and commit it, storing its response under `key` in the same transaction.
+
+    place() returns (body, remaining coins, position ids touched) or raises
+    BetRejected. Returns (body, replayed): a key that was already committed is
+    answered from its stored body without running place(), and one committed
+    by a concurrent request rolls this one back and returns that body (even if
+    this attempt was rejected, e.g. because the first bet spent the coins).
+    """
+    stored = stored_response(user_id, key, fingerprint) if key else None
+    if stored is not None:
+        return stored, True
+    try:
+        body, remaining_coins, position_ids = place()
+        if key and body['success']:
+            db.session.add(IdempotencyKey(user_id=user_id, key=key, fingerprint=fingerprint,
+                                          response=json.dumps(body)))
+        db.session.commit()
+    except BetRejected as e:
+        db.session.rollback()
+        stored = stored_response(user_id, key, fingerprint) if key else None
+        if stored is not None:
+            return stored, True
+        return {'success': False, 'message': str(e)}, False
+    except sa_exc.IntegrityError:
+        db.session.rollback()
+        stored = stored_response(user_id, key, fingerprint) if key else None
+        if stored is None:
+            raise
+        return stored, True
+    if remaining_coins is not None:
+        leaderboard_cache.update([(user_id, remaining_coins)])
+        publish_balances([(user_id, remaining_coins)])
+        odds_engine.mark(*position_ids)
+        if page_cache is not None and position_ids:
+            # The bet moved these departments' pools; don't serve them from before it
+            invalidate_department_pages(*db.session.execute(
+                select(Position.department_id).where(Position.id.in_(position_ids)).distinct()).scalars())
+    return body, False
+
+
+def idempotent_response(user_id, fingerprint, place):
+    """Respond to a bet request, at most once per user and Idempotency-Key header (see IDEMPOTENCY)."""
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        return jsonify(_commit_keyed(user_id, None, None, place)[0])
+    if len(key) > IDEMPOTENCY_KEY_MAX:
+        return jsonify({'success': False,
+                        'message': f'Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX} characters'}), 400
+
+    scoped_key = f'{user_id}:{key}'
+    flight, leader = bet_requests.begin(scoped_key)
+    if not leader:
+        if not flight.done.wait(app.config['IDEMPOTENCY_WAIT']):
+            return jsonify({'success': False, 'message': 'The original request is still being processed'}), 409
+        if flight.result is not None:
+            if flight.result[0] != fingerprint:
+                return jsonify({'success': False,
+                                'message': 'This idempotency key was already used for a different bet'}), 422
+            response = jsonify(flight.result[1])
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        # The first request was rejected or failed; this one tries for real
+
+    result = None
+    try:
+        body, replayed = _commit_keyed(user_id, key, fingerprint, place)
+        if body['success']:
+            result = (fingerprint, body)
+    except IdempotencyConflict as e:
+        return jsonify({'success': False, 'message': str(e)}), 422
+    finally:
+        if leader:
+            bet_requests.finish(scoped_key, flight, result)
+    if leader and bet_requests.prune_due(3600):
+        prune_idempotency_keys()
+    response = jsonify(body)
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
 
 
 @app.route('/bet', methods=['POST'])
+@query_budget(7)
 def place_bet():
     data = request.json
     user_id = data.get('user_id')
     candidate_id = data.get('candidate_id')
     amount = int(data.get('amount', 0))
-    
-    user = User.query.get(user_id)
-    candidate = Candidate.query.get(candidate_id)
-    
-    if not user or not candidate:
-        return jsonify({'success': False, 'message': 'Invalid user or candidate'})
-    
-    if candidate.is_laid_off:
-        return jsonify({'success': False, 'message': 'Too late! They are already gone! 💀'})
-    
-    if amount <= 0:
-        return jsonify({'success': False, 'message': 'Bet amount must be positive'})
-    
-    if user.coins < amount:
-        return jsonify({'success': False, 'message': 'Not enough coins! You are as broke as the company! 💸'})
-    
-    # Deduct coins
-    user.coins -= amount
-    
-    # Create bet
-    bet = Bet(user_id=user_id, candidate_id=candidate_id, 
-              amount=amount, odds_at_bet=candidate.odds)
-    db.session.add(bet)
-    db.session.commit()
-    
-    return jsonify({
-        'success': True, 
-        'message': f'Bet placed on {candidate.name}! 🎰',
-        'remaining_coins': user.coins,
-        'potential_win': int(amount * candidate.odds)
-    })
+
+    def place():
+        result = place_bet_atomic(user_id, candidate_id, amount)
+        return {
+            'success': True,
+            'message': f'Bet placed on {result["candidate_name"]}! 🎰',
+            'remaining_coins': result['remaining_coins'],
+            'potential_win': result['potential_win']
+        }, result['remaining_coins'], [result['position_id']]
+
+    return idempotent_response(user_id, bet_fingerprint(candidate_id, amount), place)
+
+
+@app.route('/bet/batch', methods=['POST'])
+@query_budget(8)
+def place_bets():
+    data = request.get_json(silent=True) or {}
+    try:
+        user_id = int(data.get('user_id'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'A numeric user_id is required'}), 400
+    try:
+        # Ids may arrive as strings; normalise so candidate lookups and the fingerprint match
+        items = [(int(item['candidate_id']), int(item.get('amount', 0))) for item in data.get('bets') or []]
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({'success': False, 'message': 'Each bet needs a candidate_id and an amount'}), 400
+    if not items or len(items) > BET_BATCH_MAX:
+        return jsonify({'success': False, 'message': f'Send between 1 and {BET_BATCH_MAX} bets'}), 400
+
+    def place():
+        results, remaining_coins, position_ids = place_bets_atomic(user_id, items)
+        placed = [r for r in results if r['success']]
+        body = {
+            'success': bool(placed),
+            'message': f'{len(placed)} of {len(results)} bet(s) placed! 🎰' if placed else 'No bets placed',
+            'results': results,
+            'staked': sum(r['amount'] for r in placed),
+            'potential_win': sum(r['potential_win'] for r in placed),
+        }
+        if remaining_coins is not None:
+            body['remaining_coins'] = remaining_coins
+        return body, remaining_coins, position_ids
+
+    fingerprint = hashlib.sha1(json.dumps(items).encode()).hexdigest()
+    return idempotent_response(user_id, fingerprint, place)
 
 
 @app.route('/leaderboard')
+@query_budget(1)
 def leaderboard():
-    users = User.query.order_by(User.coins.desc()).limit(50).all()
+    # Not page-cached: leaderboard_cache already renders it without a query, and a
+    # cached copy would show balances from before the latest bets
+    users = leaderboard_cache.top(50)
     return render_template('leaderboard.html', users=users)
 
 
+@app.route('/events')
+def events():
+    """Server-sent events: public odds/layoff changes plus the given user's balance."""
+    if not app.config['EVENTS_ENABLED']:
+        return '', 204  # EventSource gives up and app.js falls back to polling
+
+    channels = {'public'}
+    user_id = request.args.get('user_id', type=int)
+    if user_id:
+        channels.add(f'user:{user_id}')
+    last_seq = request.headers.get('Last-Event-ID', type=int)
+    heartbeat = app.config['EVENTS_HEARTBEAT']
+
+    def stream():
+        yield 'retry: 5000\n\n'
+        for message in event_broker.listen(channels, last_seq, timeout=heartbeat):
+            if message is None:
+                yield ': keepalive\n\n'  # Lets proxies and dead clients time out
+            else:
+                seq, event, data = message
+                yield f'id: {seq}\nevent: {event}\ndata: {data}\n\n'
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def _api_user_etag(user_id, balance_version):
+    # Rank stays out: each worker ranks from its own leaderboard_cache, so it would
+    # make the same balance look changed when the poll lands on another worker
+    return f"{user_id}-{balance_version}"
+
+
 @app.route('/api/user/<int:id>')
+@query_budget(2)
 def api_user(id):
+    # Idle tabs poll this; answer 304 from the version column alone when nothing changed
+    if request.if_none_match:
+        version = db.session.execute(select(User.balance_version).where(User.id == id)).scalar()
+        if version is not None and request.if_none_match.contains(_api_user_etag(id, version)):
+            response = app.response_class(status=304)
+            response.set_etag(_api_user_etag(id, version))
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
     user = User.query.get_or_404(id)
-    return jsonify({
+    response = jsonify({
         'id': user.id,
         'username': user.username,
-        'coins': user.coins
+        'coins': user.coins,
+        'rank': leaderboard_cache.rank(user.id)
     })
+    response.set_etag(_api_user_etag(user.id, user.balance_version))
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+# ============== ORG SYNC ==============
+
+# Bulk sync of the department/position tree from a nested dict
+# {department name: [{'title': ..., 'cor_code': ..., 'total_employees': ...,
+# 'positions_to_cut': ...}]}, used by seed_db(), seed_data.py and update_cuts.py.
+# Departments match by name and positions by title within their department;
+# rows that only exist in the database are reported, never deleted, and so are
+# titles shared by several positions of a department (which one to change is
+# ambiguous, so none are).
+ORG_POSITION_FIELDS = ('cor_code', 'total_employees', 'positions_to_cut')
+ORG_SYNC_CHUNK = 500
+
+
+class OrgDiff:
+    """What a sync would insert and update."""
+
+    def __init__(self):
+        self.new_departments = []    # name
+        self.new_positions = []      # (department name, position dict)
+        self.updated_positions = []  # (department name, existing row, {field: (old, new)})
+        self.skipped = []            # (department name, title) in the data but not created
+        self.untouched = []          # (department name, title) in the database but not the data
+        self.duplicates = []         # (department name, title, rows) matching several positions, left alone
+        self.unchanged = 0
+
+    @property
+    def changed(self):
+        return bool(self.new_departments or self.new_positions or self.updated_positions)
+
+    def report(self):
+        lines = [f"+ department {name}" for name in self.new_departments]
+        lines += [f"+ position   {dept} / {pos['title']}" for dept, pos in self.new_positions]
+        for dept, row, changes in self.updated_positions:
+            fields = ', '.join(f"{field} {old!r} -> {new!r}" for field, (old, new) in changes.items())
+            lines.append(f"~ position   {dept} / {row.title}: {fields}")
+        lines += [f"? not found  {dept} / {title}" for dept, title in self.skipped]
+        lines += [f"= db only    {dept} / {title}" for dept, title in self.untouched]
+        lines += [f"! duplicate  {dept} / {title}: {len(rows)} positions share this title, none changed"
+                  for dept, title, rows in self.duplicates]
+        lines.append(f"{len(self.new_departments)} department(s) and {len(self.new_positions)} position(s) "
+                     f"to insert, {len(self.updated_positions)} to update, {self.unchanged} unchanged")
+        return lines
+
+
+def load_org_tree():
+    """{department name: (department id, {position title: [rows]})} in one query."""
+    rows = db.session.execute(
+        select(Department.id, Department.name, Position.id.label('position_id'), Position.title,
+               Position.cor_code, Position.total_employees, Position.positions_to_cut)
+        .outerjoin(Position, Position.department_id == Department.id)
+        .order_by(Department.id, Position.id)
+    ).all()
+    tree = {}
+    for row in rows:
+        _, positions = tree.setdefault(row.name, (row.id, {}))
+        if row.position_id is not None:
+            positions.setdefault(row.title, []).append(row)
+    return tree
+
+
+def diff_org(data, tree, fields=ORG_POSITION_FIELDS, create=True):
+    """Compare the data against a loaded tree; `create=False` only updates existing rows."""
+    diff = OrgDiff()
+    for dept_name, positions in data.items():
+        _, current = tree.get(dept_name, (None, {}))
+        if dept_name not in tree:
+            if not create:
+                diff.skipped.extend((dept_name, pos['title']) for pos in positions)
+                continue
+            diff.new_departments.append(dept_name)
+        for pos in positions:
+            rows = current.get(pos['title'], [])
+            if not rows:
+                if create:
+                    diff.new_positions.append((dept_name, pos))
+                else:
+                    diff.skipped.append((dept_name, pos['title']))
+                continue
+            if len(rows) > 1:
+                diff.duplicates.append((dept_name, pos['title'], rows))
+                continue
+            row, = rows
+            changes = {field: (getattr(row, field), pos[field])
+                       for field in fields if field in pos and getattr(row, field) != pos[field]}
+            if changes:
+                diff.updated_positions.append((dept_name, row, changes))
+            else:
+                diff.unchanged += 1
+        listed = {pos['title'] for pos in positions}
+        diff.untouched.extend((dept_name, title) for title in current if title not in listed)
+    return diff
+
+
+def _chunks(rows):
+    for start in range(0, len(rows), ORG_SYNC_CHUNK):
+        yield rows[start:start + ORG_SYNC_CHUNK]
+
+
+def apply_org_diff(diff, tree):
+    """Apply a diff with one multi-row statement per table; the caller commits.
+
+    Updates are an INSERT ... ON CONFLICT (id) DO UPDATE over the existing
+    primary keys, so changing a hundred positions is a single statement rather
+    than a hundred UPDATEs.
+    """
+    dept_ids = {name: dept_id for name, (dept_id, _) in tree.items()}
+    for chunk in _chunks(diff.new_departments):
+        inserted = db.session.execute(
+            insert(Department).values([{'name': name, 'code': name[:3].upper()} for name in chunk])
+            .returning(Department.id, Department.name)
+        ).all()
+        dept_ids.update((name, dept_id) for dept_id, name in inserted)
+
+    for chunk in _chunks(diff.new_positions):
+        db.session.execute(insert(Position).values([
+            {'title': pos['title'], 'cor_code': pos.get('cor_code'), 'total_employees': pos.get('total_employees', 0),
+             'positions_to_cut': pos.get('positions_to_cut', 0), 'department_id': dept_ids[dept_name]}
+            for dept_name, pos in chunk
+        ]))
+
+    for chunk in _chunks(diff.updated_positions):
+        rows = []
+        for dept_name, row, changes in chunk:
+            values = {field: getattr(row, field) for field in ORG_POSITION_FIELDS}
+            values.update((field, new) for field, (_, new) in changes.items())
+            rows.append({'id': row.position_id, 'title': row.title, 'department_id': dept_ids[dept_name], **values})
+        stmt = dialect_insert(Position).values(rows)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[Position.id],
+            set_={field: stmt.excluded[field] for field in ORG_POSITION_FIELDS},
+        ))
+
+
+def commit_org_diff(diff, tree):
+    """Apply and commit a diff, then settle and re-price positions whose cuts changed."""
+    apply_org_diff(diff, tree)
+    db.session.commit()
+    cut_ids = [row.position_id for _, row, changes in diff.updated_positions if 'positions_to_cut' in changes]
+    if cut_ids:
+        apply_cut_changes(*Position.query.filter(Position.id.in_(cut_ids)).all())
+    invalidate_department_pages(*(dept_id for dept_id, _ in tree.values()))
+
+
+def sync_org(data, fields=ORG_POSITION_FIELDS, create=True, dry_run=False):
+    """Diff the data against the database and, unless dry_run, apply it in one transaction."""
+    tree = load_org_tree()
+    diff = diff_org(data, tree, fields, create)
+    if diff.changed and not dry_run:
+        commit_org_diff(diff, tree)
+    return diff
+
+
+def seed_positions(seed_data):
+    """SEED_DATA entries ({'title', 'cor_code', 'total', 'cut'}) as sync_org() position dicts."""
+    return {
+        dept_name: [{'title': p['title'], 'cor_code': p['cor_code'], 'total_employees': p['total'],
+                     'positions_to_cut': p.get('cut', 0)} for p in positions]
+        for dept_name, positions in seed_data.items()
+    }
 
 
 # ============== SEED DATA ==============
@@ -525,13 +3111,181 @@ SEED_DATA = {
 }
 
 
+# ============== MIGRATIONS ==============
+
+# db.create_all() builds fresh databases from the models; these bring existing
+# ones up to date. Each runs once, in order, and must be safe on a database
+# create_all() already built. Append new ones, never edit applied ones.
+
+USER_COUNTER_COLUMNS = ['bets_placed', 'bets_won', 'bets_pending', 'total_staked', 'total_won',
+                        'pending_exposure', 'balance_version']
+
+
+def add_missing_columns(model, names=None):
+    """ALTER TABLE ADD COLUMN for mapped columns (optionally only `names`) the table lacks.
+
+    Types come from the model; a column gets its server default or scalar
+    default, and NOT NULL only when it has one. Returns the added names.
+    """
+    connection = db.session.connection()
+    dialect = connection.dialect
+    table = model.__table__
+    existing = {col['name'] for col in db.inspect(connection).get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing or (names is not None and column.name not in names):
+            continue
+        ddl = (f'ALTER TABLE {dialect.identifier_preparer.format_table(table)} '
+               f'ADD COLUMN {dialect.identifier_preparer.format_column(column)} {column.type.compile(dialect=dialect)}')
+        if column.server_default is not None:
+            default = str(column.server_default.arg)
+        elif column.default is not None and column.default.is_scalar:
+            default = str(db.literal(column.default.arg, column.type)
+                          .compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+        else:
+            default = None
+        if default is not None:
+            ddl += f' DEFAULT {default}' + ('' if column.nullable else ' NOT NULL')
+        db.session.execute(db.text(ddl))
+        added.append(column.name)
+    return added
+
+
+def _migrate_user_counters():
+    add_missing_columns(User, USER_COUNTER_COLUMNS)
+    db.session.commit()
+    recompute_user_stats()
+    recompute_betting_pools()
+
+
+HOT_PATH_INDEXES = {
+    User: ['ix_user_coins'],
+    Bet: ['ix_bet_user_created', 'ix_bet_candidate_resolved'],
+    Candidate: ['ix_candidate_position_laid_off'],
+    Position: ['ix_position_department'],
+}
+
+
+def _migrate_hot_path_indexes():
+    connection = db.session.connection()
+    for model, names in HOT_PATH_INDEXES.items():
+        for index in model.__table__.indexes:
+            if index.name in names:
+                index.create(bind=connection, checkfirst=True)
+
+
+def _migrate_base_odds():
+    add_missing_columns(Candidate, ['base_odds'])
+    db.session.execute(update(Candidate).where(Candidate.base_odds.is_(None)).values(base_odds=Candidate.odds))
+
+
+def _migrate_coin_ledger():
+    connection = db.session.connection()
+    LedgerEntry.__table__.create(bind=connection, checkfirst=True)
+    BalanceSnapshot.__table__.create(bind=connection, checkfirst=True)
+    adopt_balances()
+
+
+def _migrate_idempotency_keys():
+    IdempotencyKey.__table__.create(bind=db.session.connection(), checkfirst=True)
+
+
+def _migrate_settlement_shortfall():
+    add_missing_columns(SettlementJob, ['shortfall'])
+
+
+def _migrate_settlement_heartbeat():
+    add_missing_columns(SettlementJob, ['heartbeat_at'])
+
+
+def _migrate_covering_bet_index():
+    connection = db.session.connection()
+    index, = (index for index in Bet.__table__.indexes if index.name == 'ix_bet_candidate_resolved')
+    existing = {ix['name']: ix['column_names'] for ix in db.inspect(connection).get_indexes('bet')}
+    if existing.get(index.name) != [column.name for column in index.columns]:
+        if index.name in existing:
+            index.drop(bind=connection)
+        index.create(bind=connection)
+
+
+MIGRATIONS = [
+    (1, 'Per-user bet counters, balance version and betting pools', _migrate_user_counters),
+    (2, 'Indexes for leaderboard, bet history, settlement and the department tree', _migrate_hot_path_indexes),
+    (3, 'Opening odds for the odds engine', _migrate_base_odds),
+    (4, 'Coin ledger, opening from the current balances', _migrate_coin_ledger),
+    (5, 'Idempotency keys for /bet', _migrate_idempotency_keys),
+    (6, 'Clawback shortfall on settlement jobs', _migrate_settlement_shortfall),
+    (7, 'Heartbeat lease on settlement jobs', _migrate_settlement_heartbeat),
+    (8, 'Covering bet index for the what-if report', _migrate_covering_bet_index),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_schema_version():
+    """Last applied migration, 0 for a database that never ran any, None without app_meta."""
+    try:
+        marker = db.session.execute(select(AppMeta.value).where(AppMeta.key == 'migration_version')).scalar()
+    except Exception:
+        db.session.rollback()  # No app_meta table yet
+        return None
+    return int(marker or 0)
+
+
+def run_migrations():
+    """Apply pending migrations in order, recording each one as it commits."""
+    applied = current_schema_version() or 0
+    for version, description, upgrade in MIGRATIONS:
+        if version <= applied:
+            continue
+        upgrade()
+        marker = db.session.get(AppMeta, 'migration_version') or AppMeta(key='migration_version')
+        marker.value = str(version)
+        db.session.add(marker)
+        db.session.commit()
+        print(f"Migration {version} applied: {description}")
+    return applied
+
+
 # ============== INIT ==============
 
-def init_db():
-    """Initialize database, create admin, and seed data if empty"""
-    db.create_all()
-    
-    # Create default admin if not exists
+# Phase name -> seconds, filled in as the app starts (see startup_report())
+STARTUP_TIMINGS = {}
+
+
+class _timed:
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        STARTUP_TIMINGS[self.phase] = time.perf_counter() - self.started
+
+
+def startup_report():
+    total = sum(STARTUP_TIMINGS.values())
+    phases = ', '.join(f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in STARTUP_TIMINGS.items())
+    return f"Startup {total * 1000:.0f}ms ({phases})"
+
+
+def schema_is_current():
+    """True when the migration marker says the schema is up to date."""
+    return current_schema_version() == SCHEMA_VERSION
+
+
+_admin_checked = False
+
+
+def ensure_default_admin():
+    """Create the default admin if missing; checked once per process.
+
+    Password hashing is deliberately slow, so fast starts defer this to the
+    first login attempt instead of paying for it on every cold start.
+    """
+    global _admin_checked
+    if _admin_checked:
+        return
     try:
         if not Admin.query.filter_by(username='admin').first():
             admin = Admin(username='admin')
@@ -539,50 +3293,74 @@ def init_db():
             db.session.add(admin)
             db.session.commit()
             print("Default admin created: admin / layoffs2024")
+        _admin_checked = True
     except Exception as e:
+        db.session.rollback()
         print(f"Admin setup error: {e}")
+
+
+def seed_db():
+    """Seed departments, positions and a sample candidate if the database is empty"""
+    if Department.query.first():
+        return
+    sync_org(seed_positions(SEED_DATA))
+    print("Database seeded with departments and positions")
     
-    # Seed departments and positions if empty
-    try:
-        if not Department.query.first():
-            for dept_name, positions in SEED_DATA.items():
-                dept = Department(name=dept_name, code=dept_name[:3].upper())
-                db.session.add(dept)
-                db.session.flush()
-                
-                for pos_data in positions:
-                    position = Position(
-                        title=pos_data["title"],
-                        cor_code=pos_data["cor_code"],
-                        total_employees=pos_data["total"],
-                        positions_to_cut=pos_data["cut"],
-                        department_id=dept.id
-                    )
-                    db.session.add(position)
-            
+    # Seed candidates
+    cc_dept = Department.query.filter_by(name="CC (Caesars Slots)").first()
+    if cc_dept:
+        qa_pos = Position.query.filter_by(
+            department_id=cc_dept.id, 
+            title="Manual QA Engineer"
+        ).first()
+        if qa_pos:
+            candidate = Candidate(
+                name="Octavian Cristea",
+                position_id=qa_pos.id,
+                odds=2.0,
+                base_odds=2.0,
+                bio="Senior QA Engineer",
+                photo="default.png"
+            )
+            db.session.add(candidate)
             db.session.commit()
-            print("Database seeded with departments and positions")
-            
-            # Seed candidates
-            cc_dept = Department.query.filter_by(name="CC (Caesars Slots)").first()
-            if cc_dept:
-                qa_pos = Position.query.filter_by(
-                    department_id=cc_dept.id, 
-                    title="Manual QA Engineer"
-                ).first()
-                if qa_pos:
-                    candidate = Candidate(
-                        name="Octavian Cristea",
-                        position_id=qa_pos.id,
-                        odds=2.0,
-                        bio="Senior QA Engineer",
-                        photo="default.png"
-                    )
-                    db.session.add(candidate)
-                    db.session.commit()
-                    print("Candidate seeded: Octavian Cristea")
-    except Exception as e:
-        print(f"Seed error: {e}")
+            print("Candidate seeded: Octavian Cristea")
+
+
+def init_db(fast=False):
+    """Initialize database, create admin, and seed data if empty.
+
+    With fast=True (serverless cold starts) schema and seed work is skipped
+    when the schema marker is current, and the admin bootstrap waits for the
+    first login.
+    """
+    with _timed('schema_check'):
+        current = fast and schema_is_current()
+    
+    if not current:
+        with _timed('create_all'):
+            db.create_all()
+        with _timed('migrations'):
+            run_migrations()
+        
+        # Seed departments and positions if empty
+        with _timed('seed'):
+            try:
+                seed_db()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Seed error: {e}")
+    
+    # Create default admin if not exists; serverless cold starts leave stalled
+    # jobs to the admin jobs page instead of racing each other to resume them
+    if not fast:
+        with _timed('resume_jobs'):
+            resume_settlement_jobs()
+        with _timed('admin_bootstrap'):
+            ensure_default_admin()
+
+
+STARTUP_TIMINGS['import_app'] = time.perf_counter() - _import_started
 
 
 if __name__ == '__main__':
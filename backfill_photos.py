@@ -0,0 +1,72 @@
+"""
+Move existing candidate photos to content-addressed storage and generate their
+thumbnails (see PHOTOS in app.py). New uploads get this at upload time; run
+this once for photos uploaded before, and again after changing
+PHOTO_THUMB_SIZES to fill in the missing sizes.
+
+Original files under their old names are left in place; pass --prune to delete
+the ones no candidate references any more.
+
+Usage:
+  python backfill_photos.py [--dry-run] [--prune]
+"""
+
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db, Candidate, store_photo, photo_digest, PhotoRejected
+
+
+def backfill_photos(dry_run=False, prune=False):
+    with app.app_context():
+        folder = app.config['UPLOAD_FOLDER']
+        print("\n🖼️  BACKFILLING CANDIDATE PHOTOS 🖼️\n")
+        converted = refreshed = missing = rejected = 0
+        for candidate in Candidate.query.order_by(Candidate.id):
+            path = os.path.join(folder, candidate.photo or '')
+            if not candidate.photo or not os.path.isfile(path):
+                if candidate.photo and candidate.photo != 'default.png':
+                    print(f"⚠️  {candidate.name}: {candidate.photo} not found")
+                    missing += 1
+                continue
+            if dry_run:
+                print(f"  {candidate.name}: {candidate.photo}")
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            try:
+                name = store_photo(data)  # Also writes any thumbnails that are missing
+            except PhotoRejected as e:
+                print(f"❌ {candidate.name}: {candidate.photo} ({e})")
+                rejected += 1
+                continue
+            if name != candidate.photo:
+                print(f"✅ {candidate.name}: {candidate.photo} -> {name}")
+                candidate.photo = name
+                converted += 1
+            else:
+                refreshed += 1
+        if not dry_run:
+            db.session.commit()
+
+        pruned = 0
+        if prune and not dry_run:
+            referenced = {photo for (photo,) in db.session.query(Candidate.photo)}
+            for entry in os.listdir(folder):
+                path = os.path.join(folder, entry)
+                if os.path.isfile(path) and not photo_digest(entry) and entry not in referenced:
+                    os.remove(path)
+                    pruned += 1
+
+        print(f"\n{converted} converted, {refreshed} already content-addressed, "
+              f"{missing} missing, {rejected} unreadable, {pruned} old file(s) pruned.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='list the photos that would be processed')
+    parser.add_argument('--prune', action='store_true', help='delete old uploads no candidate references')
+    args = parser.parse_args()
+    backfill_photos(dry_run=args.dry_run, prune=args.prune)
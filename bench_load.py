@@ -0,0 +1,316 @@
+"""
+Load-test the public and bet endpoints against a synthetic dataset.
+
+Seeds SEED_DATA departments and positions (copied --scale times) plus
+synthetic candidates, users and bets, then drives /, /department/<id>,
+/leaderboard, /user/<id>, /api/user/<id> and /bet from --concurrency client
+threads for --seconds, and reports throughput and p50/p95/p99 latency per
+endpoint. /api/user polls send If-None-Match like static/js/app.js does.
+bet_batch (off by default) places BATCH_SIZE bets per /bet/batch request;
+compare e.g. --mix bet=1 with --mix bet_batch=1.
+
+The database comes from DATABASE_URL as usual (a throwaway SQLite file when
+unset), so the same run works against SQLite and a local Postgres:
+
+  python bench_load.py --users 5000 --bets 50000 --concurrency 32
+  DATABASE_URL=postgresql://localhost/layoffs_bench python bench_load.py --reset
+
+By default the app is served in-process by Werkzeug's threaded server, which
+shares the GIL with the client threads. For numbers closer to production,
+start the app yourself (e.g. gunicorn against the same DATABASE_URL), seed
+with --seed-only, then point the load at it with --url.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, update
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SYNTHETIC_PREFIX = 'load_'
+INSERT_CHUNK = 5000
+DEFAULT_MIX = 'index=2,department=3,leaderboard=2,user=2,api_user=6,bet=1'
+BATCH_SIZE = 10
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint '{name}' in --mix (choose from {', '.join(ENDPOINTS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+# ============== SEEDING ==============
+
+def _bulk_insert(market, model, rows):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        market.db.session.execute(insert(model), rows[start:start + INSERT_CHUNK])
+
+
+def seed(market, scale, users, candidates_per_position, bets, reset):
+    """Create the schema and synthetic data; reuse it when a previous run left it behind."""
+    db = market.db
+    if reset:
+        db.drop_all()
+    market.init_db()
+
+    if market.User.query.filter(market.User.username.like(f'{SYNTHETIC_PREFIX}%')).first():
+        print("Reusing synthetic data already in the database (pass --reset to rebuild)")
+        return
+
+    started = time.perf_counter()
+    rng = random.Random(42)
+
+    for copy in range(2, scale + 1):
+        for dept_name, positions in market.SEED_DATA.items():
+            dept = market.Department(name=f"{dept_name} #{copy}", code=dept_name[:3].upper())
+            db.session.add(dept)
+            db.session.flush()
+            _bulk_insert(market, market.Position, [
+                {'title': p['title'], 'cor_code': p['cor_code'], 'total_employees': p['total'],
+                 'positions_to_cut': p['cut'], 'department_id': dept.id}
+                for p in positions
+            ])
+
+    position_ids = [pid for (pid,) in db.session.query(market.Position.id)]
+    _bulk_insert(market, market.Candidate, [
+        {'name': f"{SYNTHETIC_PREFIX}candidate_{pid}_{n}", 'odds': odds, 'base_odds': odds,
+         'is_laid_off': False, 'position_id': pid}
+        for pid in position_ids for n in range(candidates_per_position)
+        for odds in [round(rng.uniform(1.2, 8.0), 2)]
+    ])
+    _bulk_insert(market, market.User, [
+        {'username': f"{SYNTHETIC_PREFIX}user_{n}", 'coins': 1000} for n in range(users)
+    ])
+    db.session.flush()
+
+    user_ids = [uid for (uid,) in db.session.query(market.User.id)
+                .filter(market.User.username.like(f'{SYNTHETIC_PREFIX}%'))]
+    candidates = db.session.query(market.Candidate.id, market.Candidate.odds).all()
+    coins = dict.fromkeys(user_ids, 1000)
+    now = datetime.utcnow()
+    bet_rows = []
+    for _ in range(bets):
+        user_id = rng.choice(user_ids)
+        candidate_id, odds = rng.choice(candidates)
+        amount = rng.randint(1, 50)
+        if coins[user_id] < amount:
+            continue
+        coins[user_id] -= amount
+        bet_rows.append({'user_id': user_id, 'candidate_id': candidate_id, 'amount': amount,
+                         'odds_at_bet': odds, 'is_resolved': False, 'won': False,
+                         'created_at': now - timedelta(seconds=rng.randint(0, 30 * 86400))})
+    _bulk_insert(market, market.Bet, bet_rows)
+    db.session.execute(update(market.User), [{'id': uid, 'coins': balance} for uid, balance in coins.items()])
+    db.session.commit()
+
+    market.recompute_user_stats()
+    market.recompute_betting_pools()
+    market.adopt_balances()  # Balances above bypass the ledger; open it from them
+    print(f"Seeded {len(market.SEED_DATA) * scale} departments, {len(position_ids)} positions, "
+          f"{len(candidates)} candidates, {len(user_ids)} users, {len(bet_rows)} bets "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+def load_targets(market):
+    """IDs the workload picks from."""
+    with market.app.app_context():
+        db = market.db
+        return {
+            'departments': [i for (i,) in db.session.query(market.Department.id)],
+            'users': [i for (i,) in db.session.query(market.User.id)
+                      .filter(market.User.username.like(f'{SYNTHETIC_PREFIX}%'))],
+            'candidates': [i for (i,) in db.session.query(market.Candidate.id)
+                           .filter(market.Candidate.is_laid_off.isnot(True))],
+        }
+
+
+# ============== WORKLOAD ==============
+
+def _get(path):
+    return lambda targets, rng: ('GET', path, None)
+
+
+ENDPOINTS = {
+    'index': _get('/'),
+    'department': lambda t, rng: ('GET', f"/department/{rng.choice(t['departments'])}", None),
+    'leaderboard': _get('/leaderboard'),
+    'user': lambda t, rng: ('GET', f"/user/{rng.choice(t['users'])}", None),
+    'api_user': lambda t, rng: ('GET', f"/api/user/{rng.choice(t['users'])}", None),
+    'bet': lambda t, rng: ('POST', '/bet', {'user_id': rng.choice(t['users']),
+                                            'candidate_id': rng.choice(t['candidates']),
+                                            'amount': rng.randint(1, 20)}),
+    'bet_batch': lambda t, rng: ('POST', '/bet/batch', {
+        'user_id': rng.choice(t['users']),
+        'bets': [{'candidate_id': rng.choice(t['candidates']), 'amount': rng.randint(1, 20)}
+                 for _ in range(BATCH_SIZE)]}),
+}
+
+
+def run_load(base_url, targets, mix, concurrency, seconds):
+    names, weights = list(mix), list(mix.values())
+    latencies = defaultdict(list)
+    counts = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def client(seed):
+        rng = random.Random(seed)
+        etags = {}  # Per-client, like one browser tab polling /api/user
+        local = defaultdict(list)
+        local_counts = defaultdict(lambda: defaultdict(int))
+        while not stop.is_set():
+            name = rng.choices(names, weights)[0]
+            method, path, payload = ENDPOINTS[name](targets, rng)
+            headers = {}
+            body = None
+            if payload is not None:
+                body = json.dumps(payload).encode()
+                headers['Content-Type'] = 'application/json'
+            if name == 'api_user' and path in etags:
+                headers['If-None-Match'] = etags[path]
+            request = urllib.request.Request(base_url + path, data=body, headers=headers, method=method)
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    content = response.read()
+                    status = response.status
+                    if name == 'api_user' and response.headers.get('ETag'):
+                        etags[path] = response.headers['ETag']
+                    if name in ('bet', 'bet_batch') and not json.loads(content).get('success'):
+                        local_counts[name]['rejected'] += 1
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except OSError:
+                status = None
+            local[name].append(time.perf_counter() - started)
+            if status == 304:
+                local_counts[name]['not_modified'] += 1
+            elif status is None or status >= 400:
+                local_counts[name]['errors'] += 1
+        with lock:
+            for name, values in local.items():
+                latencies[name].extend(values)
+            for name, values in local_counts.items():
+                for key, value in values.items():
+                    counts[name][key] += value
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for name in names + ['total']:
+        values = sorted(latencies[name]) if name != 'total' else sorted(v for l in latencies.values() for v in l)
+        name_counts = counts[name] if name != 'total' else {
+            key: sum(c.get(key, 0) for c in counts.values()) for key in ('errors', 'rejected', 'not_modified')}
+        results[name] = {
+            'requests': len(values),
+            'rps': len(values) / elapsed,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'errors': name_counts.get('errors', 0),
+            'rejected': name_counts.get('rejected', 0),
+            'not_modified': name_counts.get('not_modified', 0),
+        }
+    return results
+
+
+def serve_in_process(market):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, market.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=1, help='copies of the SEED_DATA departments')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--candidates-per-position', type=int, default=3)
+    parser.add_argument('--bets', type=int, default=20000)
+    parser.add_argument('--reset', action='store_true', help='drop all tables before seeding')
+    parser.add_argument('--seed-only', action='store_true', help='seed and exit without generating load')
+    parser.add_argument('--url', help='load an already running app instead of serving it in-process')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'endpoint weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    # app.py reads DATABASE_URL at import time
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_load.db')
+    import app as market
+
+    with market.app.app_context():
+        seed(market, args.scale, args.users, args.candidates_per_position, args.bets, args.reset)
+    if args.seed_only:
+        return
+
+    targets = load_targets(market)
+    server = None
+    base_url = args.url.rstrip('/') if args.url else None
+    if not base_url:
+        server, base_url = serve_in_process(market)
+
+    print(f"\n🚦 LOAD: {args.concurrency} clients for {args.seconds}s against {base_url} "
+          f"({market.app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0]})\n")
+    results = run_load(base_url, targets, mix, args.concurrency, args.seconds)
+    if server:
+        server.shutdown()
+
+    print("=" * 100)
+    print(f"{'Endpoint':<12} {'Requests':>9} {'Req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'Errors':>8} {'304s':>8} {'Rejected':>9}")
+    print("=" * 100)
+    for name, r in results.items():
+        if name == 'total':
+            print("-" * 100)
+        print(f"{name:<12} {r['requests']:>9} {r['rps']:>9.0f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+              f"{r['p99_ms']:>9.2f} {r['errors']:>8} {r['not_modified']:>8} {r['rejected']:>9}")
+    print("=" * 100)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+    if results['total']['errors']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark SQLite read concurrency during write bursts: the default rollback
+journal versus the WAL pragmas the app applies (SQLITE_PRAGMAS in app.py).
+
+Writer threads hammer bet-placement-shaped transactions (conditional debit +
+insert + commit) while reader threads run leaderboard/profile-shaped queries.
+
+Usage:
+  python bench_sqlite.py [--seconds 5] [--readers 8] [--writers 2] [--users 2000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import SQLITE_PRAGMAS, SQLITE_BUSY_TIMEOUT_MS, apply_sqlite_pragmas
+
+MODES = {
+    'rollback journal': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': SQLITE_BUSY_TIMEOUT_MS},
+    'WAL (app pragmas)': SQLITE_PRAGMAS,
+}
+
+
+def connect(path, pragmas):
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    apply_sqlite_pragmas(conn, pragmas)
+    return conn
+
+
+def create_db(path, pragmas, users):
+    conn = connect(path, pragmas)
+    conn.executescript("""
+        CREATE TABLE user (id INTEGER PRIMARY KEY, username TEXT, coins INTEGER);
+        CREATE INDEX ix_user_coins ON user (coins);
+        CREATE TABLE bet (id INTEGER PRIMARY KEY, user_id INTEGER, candidate_id INTEGER,
+                          amount INTEGER, odds_at_bet REAL, created_at TEXT);
+        CREATE INDEX ix_bet_user_created ON bet (user_id, created_at);
+    """)
+    conn.executemany("INSERT INTO user (id, username, coins) VALUES (?, ?, ?)",
+                     [(i, f"user{i}", 1000) for i in range(1, users + 1)])
+    conn.commit()
+    conn.close()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def run_mode(pragmas, seconds, readers, writers, users):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    create_db(path, pragmas, users)
+    stop = threading.Event()
+    read_latencies = []
+    counts = {'writes': 0, 'write_errors': 0, 'read_errors': 0}
+    lock = threading.Lock()
+
+    def writer():
+        conn = connect(path, pragmas)
+        while not stop.is_set():
+            user_id = random.randint(1, users)
+            try:
+                conn.execute("UPDATE user SET coins = coins - 1 WHERE id = ? AND coins >= 1", (user_id,))
+                conn.execute("INSERT INTO bet (user_id, candidate_id, amount, odds_at_bet, created_at) "
+                             "VALUES (?, 1, 1, 2.0, datetime('now'))", (user_id,))
+                conn.commit()
+                with lock:
+                    counts['writes'] += 1
+            except sqlite3.OperationalError:
+                conn.rollback()
+                with lock:
+                    counts['write_errors'] += 1
+        conn.close()
+
+    def reader():
+        conn = connect(path, pragmas)
+        local = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                conn.execute("SELECT id, username, coins FROM user ORDER BY coins DESC LIMIT 50").fetchall()
+                conn.execute("SELECT * FROM bet WHERE user_id = ? ORDER BY created_at DESC LIMIT 25",
+                             (random.randint(1, users),)).fetchall()
+                conn.commit()  # End the read transaction like a finished request
+                local.append(time.perf_counter() - started)
+            except sqlite3.OperationalError:
+                with lock:
+                    counts['read_errors'] += 1
+        conn.close()
+        with lock:
+            read_latencies.extend(local)
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    read_latencies.sort()
+    return {
+        'writes_per_s': counts['writes'] / seconds,
+        'reads_per_s': len(read_latencies) / seconds,
+        'p50_ms': percentile(read_latencies, 50) * 1000,
+        'p95_ms': percentile(read_latencies, 95) * 1000,
+        'p99_ms': percentile(read_latencies, 99) * 1000,
+        'write_errors': counts['write_errors'],
+        'read_errors': counts['read_errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--users', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"\n🏎️  SQLITE READ CONCURRENCY: {args.readers} readers vs {args.writers} writers, {args.seconds}s each\n")
+    print("=" * 94)
+    print(f"{'Mode':<20} {'Writes/s':>10} {'Reads/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'W errors':>9} {'R errors':>9}")
+    print("=" * 94)
+    for name, pragmas in MODES.items():
+        r = run_mode(pragmas, args.seconds, args.readers, args.writers, args.users)
+        print(f"{name:<20} {r['writes_per_s']:>10.0f} {r['reads_per_s']:>10.0f} {r['p50_ms']:>9.2f} "
+              f"{r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['write_errors']:>9} {r['read_errors']:>9}")
+    print("=" * 94)
+
+
+if __name__ == "__main__":
+    main()
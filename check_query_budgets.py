@@ -0,0 +1,92 @@
+"""
+Check every view's declared @query_budget against what it actually issues.
+
+Seeds a synthetic dataset (see bench_load.py) at two candidate densities,
+requests each budgeted route through the test client with query stats on and
+the page cache off, and fails if a route goes over its budget or if its query
+count grows with the number of candidates (an N+1 in the view or template).
+
+The database comes from DATABASE_URL, or a throwaway SQLite file when unset.
+It is dropped and rebuilt for each round, so only point it at a scratch
+database.
+
+Usage:
+  python check_query_budgets.py
+Exits 1 on any failure.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+CANDIDATES_PER_POSITION = (1, 10)
+BATCH_SIZE = 20
+
+
+def budget_requests(targets):
+    """One request per budgeted view: (endpoint, method, path, json)."""
+    user_id, candidate_id = targets['users'][0], targets['candidates'][0]
+    return [
+        ('index', 'GET', '/', None),
+        ('department_view', 'GET', f"/department/{targets['departments'][1]}", None),
+        ('leaderboard', 'GET', '/leaderboard', None),
+        ('user_profile', 'GET', f'/user/{user_id}', None),
+        ('api_user', 'GET', f'/api/user/{user_id}', None),
+        ('place_bet', 'POST', '/bet', {'user_id': user_id, 'candidate_id': candidate_id, 'amount': 1}),
+        ('place_bets', 'POST', '/bet/batch', {'user_id': user_id, 'bets': [
+            {'candidate_id': cid, 'amount': 1} for cid in targets['candidates'][:BATCH_SIZE]]}),
+    ]
+
+
+def measure(market, client, method, path, payload):
+    # First request warms per-process caches (leaderboard), the second is measured
+    for _ in range(2):
+        response = client.open(path, method=method, json=payload)
+    return int(response.headers['X-Query-Count']), response.status_code
+
+
+def check_query_budgets():
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'budgets.db'))
+    os.environ['PAGE_CACHE_BACKEND'] = 'none'
+    os.environ['QUERY_STATS_ENABLED'] = '1'
+    import app as market
+    import bench_load
+
+    counts = {}
+    for per_position in CANDIDATES_PER_POSITION:
+        with market.app.app_context():
+            bench_load.seed(market, scale=1, users=50, candidates_per_position=per_position, bets=500, reset=True)
+        market.leaderboard_cache.invalidate()
+        client = market.app.test_client()
+        for endpoint, method, path, payload in budget_requests(bench_load.load_targets(market)):
+            counts.setdefault(endpoint, {})[per_position] = measure(market, client, method, path, payload)
+
+    failures = 0
+    unchecked = set(market.QUERY_BUDGETS) - set(counts)
+    print(f"\n📏 QUERY BUDGETS (candidates per position: {', '.join(map(str, CANDIDATES_PER_POSITION))}) 📏\n")
+    for endpoint, by_density in counts.items():
+        budget = market.QUERY_BUDGETS.get(endpoint)
+        queries = [count for count, _ in by_density.values()]
+        problems = []
+        if budget is None:
+            problems.append('no @query_budget declared')
+        elif max(queries) > budget:
+            problems.append(f'over budget of {budget}')
+        if len(set(queries)) > 1:
+            problems.append('grows with candidate count')
+        if any(status >= 500 for _, status in by_density.values()):
+            problems.append('server error')
+        failures += bool(problems)
+        print(f"{'❌' if problems else '✅'} {endpoint:<16} queries {' → '.join(map(str, queries))} "
+              f"(budget {budget}){'  ' + ', '.join(problems) if problems else ''}")
+    for endpoint in sorted(unchecked):
+        print(f"⚠️  {endpoint:<16} has a budget but no request in budget_requests()")
+
+    print(f"\n{failures} route(s) failed." if failures else "\nAll routes within budget.")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if check_query_budgets() else 0)
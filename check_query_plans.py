@@ -0,0 +1,108 @@
+"""
+Check that the hot queries are served by an index rather than a full table
+scan, by running EXPLAIN against the configured database (DATABASE_URL or
+the local SQLite file). Applies pending migrations first.
+
+On SQLite this reads EXPLAIN QUERY PLAN; on Postgres sequential scans are
+disabled for the session so an empty table still shows whether a usable
+index exists.
+
+Usage:
+  python check_query_plans.py
+Exits 1 if any query falls back to a table scan.
+"""
+
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import select, func, and_, or_
+
+from app import app, db, User, Bet, Candidate, Position, LedgerEntry, run_migrations
+
+
+def hot_queries():
+    now = datetime.utcnow()
+    return {
+        'leaderboard (users by coins)': (
+            select(User.id, User.username, User.coins).order_by(User.coins.desc()).limit(100),
+            'user',
+        ),
+        'bet history page': (
+            select(Bet.id, Bet.amount, Bet.created_at)
+            .where(Bet.user_id == 1, or_(Bet.created_at < now, and_(Bet.created_at == now, Bet.id < 1)))
+            .order_by(Bet.created_at.desc(), Bet.id.desc()).limit(26),
+            'bet',
+        ),
+        'settlement (open bets on a candidate)': (
+            select(Bet.id, Bet.user_id, Bet.amount).where(Bet.candidate_id == 1, Bet.is_resolved.isnot(True)),
+            'bet',
+        ),
+        'what-if (open bets on a set of candidates)': (
+            select(Bet.user_id, Bet.candidate_id, Bet.amount, Bet.odds_at_bet)
+            .where(Bet.candidate_id.in_([1, 2, 3]), Bet.is_resolved.isnot(True)),
+            'bet',
+        ),
+        'open candidates for a position': (
+            select(Candidate.id).where(Candidate.position_id == 1, Candidate.is_laid_off.isnot(True)),
+            'candidate',
+        ),
+        'ledger tail after a snapshot': (
+            select(func.sum(LedgerEntry.amount)).where(LedgerEntry.user_id == 1, LedgerEntry.id > 1),
+            'ledger_entry',
+        ),
+        'positions in a department': (
+            select(Position.id, Position.title).where(Position.department_id == 1),
+            'position',
+        ),
+    }
+
+
+def explain(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}').all()
+        return [row[-1] for row in rows]
+    rows = connection.exec_driver_sql(f'EXPLAIN {compiled}').all()
+    return [row[0] for row in rows]
+
+
+def uses_table_scan(dialect, plan, table):
+    for line in plan:
+        if dialect == 'sqlite':
+            # "SCAN user" is a full scan; "SCAN user USING INDEX ..." walks an index
+            if line.startswith(f'SCAN {table}') and 'INDEX' not in line:
+                return True
+        elif 'Seq Scan on' in line and f' {table}' in line:
+            return True
+    return False
+
+
+def check_query_plans():
+    with app.app_context():
+        db.create_all()
+        run_migrations()
+        failures = 0
+        with db.engine.connect() as connection:
+            dialect = connection.dialect.name
+            if dialect == 'postgresql':
+                connection.exec_driver_sql('SET enable_seqscan = off')
+            print(f"\n🔍 QUERY PLANS ({dialect}) 🔍\n")
+            for name, (statement, table) in hot_queries().items():
+                plan = explain(connection, statement)
+                bad = uses_table_scan(dialect, plan, table)
+                failures += bad
+                print(f"{'❌' if bad else '✅'} {name}")
+                for line in plan:
+                    print(f"     {line}")
+        if failures:
+            print(f"\n{failures} hot quer{'y' if failures == 1 else 'ies'} fell back to a table scan.")
+        else:
+            print("\nAll hot queries use an index.")
+        return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if check_query_plans() else 0)
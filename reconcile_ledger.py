@@ -0,0 +1,48 @@
+"""
+Check every user's coins against the coin ledger, then roll the balance
+snapshots forward (see LEDGER in app.py). Run it periodically, e.g. from cron:
+each run keeps balance rebuilds down to the entries since the last one.
+
+Snapshots are only taken when the ledger reconciles, so a mismatch stays
+visible until someone looks at it.
+
+Usage:
+  python reconcile_ledger.py [--no-snapshot]
+Exits 1 if any balance disagrees with the ledger.
+"""
+
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db, run_migrations, reconcile_balances, snapshot_balances
+
+SHOWN = 50
+
+
+def reconcile_ledger(snapshot=True):
+    with app.app_context():
+        db.create_all()
+        run_migrations()
+        print("\n📒 RECONCILING THE COIN LEDGER 📒\n")
+        mismatches = reconcile_balances()
+        for row in mismatches[:SHOWN]:
+            print(f"❌ {row.username} (#{row.id}): coins {row.coins}, ledger {row.ledger} "
+                  f"({(row.coins or 0) - row.ledger:+d})")
+        if len(mismatches) > SHOWN:
+            print(f"   ... and {len(mismatches) - SHOWN} more")
+        if mismatches:
+            print(f"\n{len(mismatches)} balance(s) disagree with the ledger; snapshots left as they are.")
+            return len(mismatches)
+        print("✅ Every balance matches its snapshot plus ledger tail.")
+        if snapshot:
+            print(f"✅ Rolled snapshots forward for {snapshot_balances()} user(s).")
+        return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--no-snapshot', action='store_true', help='only check, do not roll snapshots forward')
+    args = parser.parse_args()
+    sys.exit(1 if reconcile_ledger(snapshot=not args.no_snapshot) else 0)
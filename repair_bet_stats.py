@@ -0,0 +1,28 @@
+"""
+Recompute the maintained bet aggregates from the Bet table:
+- per-user counters (bets placed/won/pending, staked, won, pending exposure)
+- per-candidate and per-position betting pools (bets, staked, liability)
+
+Run after importing bets by hand, or whenever the numbers look off.
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db, run_migrations, recompute_user_stats, recompute_betting_pools
+
+
+def repair_bet_stats():
+    with app.app_context():
+        print("\n🔧 REPAIRING BET AGGREGATES 🔧\n")
+        db.create_all()  # Pool tables
+        run_migrations()  # Counter columns on older databases
+        updated = recompute_user_stats()
+        print(f"\n✅ Recomputed counters for {updated} user(s) with bets.")
+        recompute_betting_pools()
+        print("✅ Recomputed candidate and position betting pools.")
+
+
+if __name__ == "__main__":
+    repair_bet_stats()
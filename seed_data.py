@@ -1,15 +1,23 @@
 """
 Seed script to populate the database with departments and positions
 Run this after starting the app at least once (to create the database)
+
+Re-running it syncs the tree: missing departments and positions are added and
+cor codes / headcounts updated in place, leaving positions_to_cut, candidates
+and bets alone.
+
+Usage:
+  python seed_data.py [--dry-run]
 """
 
+import argparse
 import os
 import sys
 
 # Add the parent directory to the path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, db, Department, Position
+from app import app, db, sync_org, seed_positions
 
 # Data parsed from the provided table
 # "total" = total employees in that position
@@ -135,57 +143,32 @@ SEED_DATA = {
 }
 
 
-def seed_database():
+def seed_database(dry_run=False):
     with app.app_context():
         # Recreate tables to add new column
         db.create_all()
         
-        # Check if data already exists
-        existing_depts = Department.query.count()
-        if existing_depts > 0:
-            print(f"⚠️  Database already has {existing_depts} departments.")
-            response = input("Do you want to clear and re-seed? (y/N): ")
-            if response.lower() != 'y':
-                print("Aborted.")
-                return
-            
-            # Clear existing data
-            print("🗑️  Clearing existing data...")
-            Position.query.delete()
-            Department.query.delete()
-            db.session.commit()
-        
-        total_positions = 0
-        total_employees = 0
-        
         print("\n💀 SEEDING THE LAYOFF DATABASE 💀\n")
         print("=" * 60)
         
+        total_positions = 0
+        total_employees = 0
         for dept_name, positions in SEED_DATA.items():
-            # Create department
-            dept = Department(name=dept_name, code=dept_name[:3].upper())
-            db.session.add(dept)
-            db.session.flush()  # Get the ID
-            
-            dept_employees = 0
-            for pos_data in positions:
-                position = Position(
-                    title=pos_data["title"],
-                    cor_code=pos_data["cor_code"],
-                    total_employees=pos_data["total"],
-                    positions_to_cut=0,  # Admin will set this
-                    department_id=dept.id
-                )
-                db.session.add(position)
-                total_positions += 1
-                dept_employees += pos_data["total"]
-            
+            dept_employees = sum(pos_data["total"] for pos_data in positions)
+            total_positions += len(positions)
             total_employees += dept_employees
             print(f"🏢 {dept_name}: {len(positions)} positions, {dept_employees} employees")
         
-        db.session.commit()
+        # positions_to_cut is the admin's to set, so the sync never touches it
+        diff = sync_org(seed_positions(SEED_DATA), fields=('cor_code', 'total_employees'), dry_run=dry_run)
         
         print("=" * 60)
+        for line in diff.report():
+            print(f"   {line}")
+        if dry_run:
+            print("\n🔍 Dry run, nothing written.")
+            return
+        
         print(f"\n✅ Database seeded successfully!")
         print(f"   📊 Total departments: {len(SEED_DATA)}")
         print(f"   💼 Total position types: {total_positions}")
@@ -197,4 +180,6 @@ def seed_database():
 
 
 if __name__ == "__main__":
-    seed_database()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='show the changes without writing them')
+    seed_database(dry_run=parser.parse_args().dry_run)
@@ -38,8 +38,18 @@ async function refreshUserData() {
     if (!userId) return;
     
     try {
-        const response = await fetch(`/api/user/${userId}`);
+        // Send the last ETag so unchanged balances come back as an empty 304
+        const etagKey = `user_etag_${userId}`;
+        const headers = {};
+        const etag = localStorage.getItem(etagKey);
+        if (etag) headers['If-None-Match'] = etag;
+        
+        const response = await fetch(`/api/user/${userId}`, {headers, cache: 'no-store'});
+        if (response.status === 304) return;
+        
         const data = await response.json();
+        const newEtag = response.headers.get('ETag');
+        if (newEtag) localStorage.setItem(etagKey, newEtag);
         localStorage.setItem('coins', data.coins);
         updateUserPanel();
     } catch (error) {
@@ -47,12 +57,66 @@ async function refreshUserData() {
     }
 }
 
+// ============== LIVE UPDATES ==============
+let pollTimer = null;
+
+function startPolling(interval = 30000) {
+    clearInterval(pollTimer);
+    pollTimer = setInterval(refreshUserData, interval);
+}
+
+function updateCandidateOdds(data) {
+    const card = document.querySelector(`.candidate-card[data-candidate-id="${data.candidate_id}"]`);
+    if (!card) return;
+    card.dataset.odds = data.odds;
+    card.querySelector('.odds-value').textContent = `${data.odds.toFixed(2)}x`;
+    const input = card.querySelector('.bet-amount');
+    const winAmount = card.querySelector('.win-amount');
+    if (input && winAmount) winAmount.textContent = Math.floor((parseInt(input.value) || 0) * data.odds);
+}
+
+function updateCandidateLayoff(data) {
+    const card = document.querySelector(`.candidate-card[data-candidate-id="${data.candidate_id}"]`);
+    if (!card || !data.is_laid_off) return;
+    card.classList.add('laid-off');
+    const controls = card.querySelector('.bet-controls');
+    if (controls) controls.outerHTML = '<div class="bet-closed">Betting Closed</div>';
+}
+
+function connectEvents() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    const userId = localStorage.getItem('user_id');
+    const source = new EventSource(userId ? `/events?user_id=${userId}` : '/events');
+    
+    // Events only reach clients of the worker that published them: resync on every
+    // (re)connect and keep a slow poll as a backstop (cheap thanks to the ETag)
+    source.addEventListener('open', refreshUserData);
+    startPolling(120000);
+    
+    source.addEventListener('balance', (e) => {
+        const data = JSON.parse(e.data);
+        localStorage.setItem('coins', data.coins);
+        updateUserPanel();
+    });
+    source.addEventListener('odds', (e) => updateCandidateOdds(JSON.parse(e.data)));
+    source.addEventListener('layoff', (e) => updateCandidateLayoff(JSON.parse(e.data)));
+    source.addEventListener('resync', refreshUserData);
+    
+    // Streaming unavailable (e.g. serverless): fall back to polling
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) startPolling();
+    };
+}
+
 // ============== INITIALIZE ==============
 document.addEventListener('DOMContentLoaded', () => {
     updateUserPanel();
     
-    // Refresh user data every 30 seconds
-    setInterval(refreshUserData, 30000);
+    // Balance, odds and layoff changes are pushed; polling is only the fallback
+    connectEvents();
     
     // Add some fun console messages
     console.log('%c💀 LAYOFF MARKET 💀', 'font-size: 24px; font-weight: bold; color: #ff3b3b;');
@@ -1,13 +1,17 @@
 """
 Update positions_to_cut based on before/after data
 positions_to_cut = total_employees (before) - after_total
+
+Usage:
+  python update_cuts.py [--dry-run]
 """
 
+import argparse
 import os
 import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, db, Department, Position
+from app import app, load_org_tree, diff_org, commit_org_diff
 
 # After-cut data (what remains after layoffs)
 AFTER_CUT_DATA = {
@@ -131,7 +135,9 @@ AFTER_CUT_DATA = {
 }
 
 
-def update_positions_to_cut():
+def update_positions_to_cut(dry_run=False):
+    # Settle and re-price before exiting rather than on background threads
+    app.config['SETTLEMENT_ASYNC'] = app.config['ODDS_ASYNC'] = False
     with app.app_context():
         total_before = 0
         total_after = 0
@@ -142,35 +148,43 @@ def update_positions_to_cut():
         print(f"{'Department':<25} {'Position':<30} {'Before':>6} {'After':>6} {'Cut':>5}")
         print("=" * 70)
         
-        departments = Department.query.all()
+        tree = load_org_tree()
+        target = {}
         
-        for dept in departments:
-            dept_name = dept.name
+        for dept_name, (_, positions) in tree.items():
             after_data = AFTER_CUT_DATA.get(dept_name, {})
             
-            for position in dept.positions:
-                before = position.total_employees
-                after = after_data.get(position.title, 0)  # Default to 0 if not in after list
+            for title, rows in positions.items():
+                before = sum(row.total_employees for row in rows)  # Several rows only if the title is duplicated
+                after = after_data.get(title, 0)  # Default to 0 if not in after list
                 cuts = before - after
                 
                 if cuts < 0:
-                    print(f"⚠️  WARNING: {dept_name} - {position.title}: after ({after}) > before ({before})")
+                    print(f"⚠️  WARNING: {dept_name} - {title}: after ({after}) > before ({before})")
                     cuts = 0
                 
-                position.positions_to_cut = cuts
+                target.setdefault(dept_name, []).append({'title': title, 'positions_to_cut': cuts})
                 total_before += before
                 total_after += after
                 total_cuts += cuts
                 
                 if cuts > 0:
-                    print(f"{dept_name:<25} {position.title:<30} {before:>6} {after:>6} {cuts:>5} 🔥")
+                    print(f"{dept_name:<25} {title:<30} {before:>6} {after:>6} {cuts:>5} 🔥")
                 else:
-                    print(f"{dept_name:<25} {position.title:<30} {before:>6} {after:>6} {cuts:>5}")
-        
-        db.session.commit()
+                    print(f"{dept_name:<25} {title:<30} {before:>6} {after:>6} {cuts:>5}")
         
         print("=" * 70)
-        print(f"\n✅ Updated successfully!")
+        diff = diff_org(target, tree, fields=('positions_to_cut',), create=False)
+        if dry_run:
+            print("\n🔍 Dry run, nothing written:")
+            for line in diff.report():
+                print(f"   {line}")
+            return
+        commit_org_diff(diff, tree)
+        for dept_name, title, rows in diff.duplicates:
+            print(f"⚠️  SKIPPED: {dept_name} - {title} matches {len(rows)} positions; set their cuts in the admin")
+        
+        print(f"\n✅ Updated {len(diff.updated_positions)} position(s) successfully!")
         print(f"   👥 Total before: {total_before}")
         print(f"   👥 Total after:  {total_after}")
         print(f"   🪓 Total cuts:   {total_cuts}")
@@ -179,5 +193,7 @@ def update_positions_to_cut():
 
 
 if __name__ == "__main__":
-    update_positions_to_cut()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='show the changes without writing them')
+    update_positions_to_cut(dry_run=parser.parse_args().dry_run)
 